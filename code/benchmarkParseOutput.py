@@ -0,0 +1,123 @@
+'''
+times each stage of parseOutputOfPowerShellSCCM.py on fake SCCM output made by generateSCCMoutput.py,
+using the saved sqlserverbuilds webpages in samples/pages so it never needs internet access
+
+    python benchmarkParseOutput.py                          (1k and 100k servers)
+    python benchmarkParseOutput.py --servers 1000000 --repeat 1
+    python benchmarkParseOutput.py --json before.json       (save the times to compare against later)
+    python benchmarkParseOutput.py --compare before.json    (and say which stages got slower)
+
+stages:
+    parse - reading the SCCM output file into ServerRecords
+    catalog - reading the saved sqlserverbuilds webpages of every SQL version in the file (the HTML parse a run does
+              whenever its cached copy is too old) and indexing them
+    enrich - working out the serversWithMSSQL.csv columns for every server with SQL
+    report - writing the two CSV files and the stats text file
+'''
+
+import os
+
+code_directory = os.path.dirname(os.path.abspath(__file__))
+default_catalogs = os.path.join(code_directory, '..', 'samples', 'catalogs')
+default_pages = os.path.join(code_directory, '..', 'samples', 'pages')
+
+
+def best_time(stage, repeat):
+    # (fastest wall time in seconds, result of the last run) of calling stage() repeat times
+    import time
+
+    best = None
+    for attempt in range(repeat):
+        start = time.perf_counter()
+        result = stage()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def benchmark(servers, work_directory, catalogs=default_catalogs, repeat=3, seed=1, pages=default_pages):
+    # {stage: fastest time in seconds} for a fake file with this many servers
+    import sys
+    sys.path.insert(0, code_directory)
+    import generateSCCMoutput
+    import parseOutputOfPowerShellSCCM as parser
+    # import these first so the first stage that uses them isn't charged for loading them
+    import numpy
+    import pandas
+
+    # the same file is used again by later benchmarks of the same size
+    input_file = os.path.join(work_directory, 'sccm-' + str(servers) + '-' + str(seed) + '.txt')
+    if not os.path.exists(input_file):
+        generateSCCMoutput.write_sccm_output(input_file, servers, seed, catalogs=catalogs)
+    output_directory = os.path.join(work_directory, 'output-' + str(servers))
+    # the pages are read again every time (refresh), this is only where the run keeps its copy of them
+    cache_directory = os.path.join(work_directory, 'catalogs')
+
+    times = {}
+    times['parse'], (records, counts) = best_time(lambda: parser.parse_sccm_file(input_file), repeat)
+    release_types = parser.release_types_in(records)
+    times['catalog'], catalog_set = best_time(lambda: parser.load_catalog_set(release_types, cache_directory, refresh=True,
+                                                                              catalog_url=pages), repeat)
+    times['enrich'], enriched = best_time(lambda: parser.enrich_records(records, catalog_set), repeat)
+    times['report'], report = best_time(lambda: parser.write_report(output_directory, records, counts, catalog_set), repeat)
+    # the report stage enriches the servers too - take that out so it's only the writing
+    times['report'] = max(0.0, times['report'] - times['enrich'])
+    return times
+
+
+def compare(results, baseline, tolerance):
+    # lines about every stage that's more than tolerance (like 0.2 = 20%) slower than in baseline
+    slower = []
+    for servers, times in results.items():
+        for stage, seconds in times.items():
+            before = baseline.get(servers, {}).get(stage)
+            if before and seconds > before * (1 + tolerance):
+                slower.append(stage + ' with ' + servers + ' servers: ' + format(before, '.3f') + 's -> ' + format(seconds, '.3f') + 's')
+    return slower
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import tempfile
+
+    argument_parser = argparse.ArgumentParser(description='Time each stage of parseOutputOfPowerShellSCCM.py on fake SCCM output.')
+    argument_parser.add_argument('--servers', default='1000,100000', metavar='COUNT,COUNT,...',
+                                 help='sizes of the fake SCCM output files (default 1000,100000)')
+    argument_parser.add_argument('--repeat', type=int, default=3, help='run each stage this many times and keep the fastest (default 3)')
+    argument_parser.add_argument('--seed', type=int, default=1, help='random seed for the fake files (default 1)')
+    argument_parser.add_argument('--catalogs', default=default_catalogs,
+                                 help='catalog fixtures the fake servers get their builds from (default samples/catalogs)')
+    argument_parser.add_argument('--pages', default=default_pages,
+                                 help='saved sqlserverbuilds webpages for the catalog stage (default samples/pages)')
+    argument_parser.add_argument('--work-dir', default=None,
+                                 help='where the fake files and output go, and are reused from next time (default a temporary directory)')
+    argument_parser.add_argument('--json', default=None, metavar='FILE', help='also save the times in FILE')
+    argument_parser.add_argument('--compare', default=None, metavar='FILE', help='compare the times with ones saved with --json')
+    argument_parser.add_argument('--tolerance', type=float, default=0.2,
+                                 help='with --compare, how much slower a stage can get before it counts (default 0.2 = 20%%)')
+    args = argument_parser.parse_args()
+
+    work_directory = args.work_dir or tempfile.mkdtemp(prefix='sccm-benchmark-')
+    os.makedirs(work_directory, exist_ok=True)
+
+    results = {}
+    print('servers'.rjust(10) + ''.join(stage.rjust(12) for stage in ['parse', 'catalog', 'enrich', 'report']) + '   servers/second')
+    for servers in [int(size) for size in args.servers.split(',')]:
+        times = benchmark(servers, work_directory, args.catalogs, args.repeat, args.seed, args.pages)
+        results[str(servers)] = times
+        print(str(servers).rjust(10) + ''.join(format(seconds, '.3f').rjust(12) for seconds in times.values()) +
+              format(servers / sum(times.values()), ',.0f').rjust(17))
+
+    if args.json is not None:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as saved:
+            slower = compare(results, json.load(saved), args.tolerance)
+        for line in slower:
+            print('SLOWER: ' + line)
+        if slower:
+            raise SystemExit(1)
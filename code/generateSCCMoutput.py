@@ -0,0 +1,152 @@
+'''
+makes fake SCCM script output files for trying out and benchmarking parseOutputOfPowerShellSCCM.py
+with a lot more servers than the sample, and rebuilds the sqlserverbuilds catalog fixtures from the
+saved webpages so it can all run without internet access
+
+    python generateSCCMoutput.py 100000 fake100k.txt
+    python generateSCCMoutput.py --catalogs ../samples/catalogs
+    python generateSCCMoutput.py 100000 fake100k-compact.txt --compact
+
+the servers are mixed like real collections: most servers don't have SQL (query returns false),
+some gave a WARNING, some gave blank output (no "[" at all), and the ones with SQL have a spread of
+2008 - 2019 builds taken from the catalog fixtures
+
+samples/pages has copies of the sqlserverbuilds webpages for 2008 - 2019 (the rows up to July 2020,
+typed in from the real pages - most, but not all, of the builds on them). The catalog fixtures in
+samples/catalogs are those pages read by parseOutputOfPowerShellSCCM.py itself, in the same format as
+the catalog cache (~/.mssql-version-sccm/catalogs), so they can be used with
+--cache-dir ../samples/catalogs --offline. They are only meant for testing, not for checking real servers!
+'''
+
+import os
+
+code_directory = os.path.dirname(os.path.abspath(__file__))
+default_pages = os.path.join(code_directory, '..', 'samples', 'pages')
+default_catalogs = os.path.join(code_directory, '..', 'samples', 'catalogs')
+
+# the SQL versions there are saved webpages for
+catalog_release_types = ['2019', '2017', '2016', '2014', '2012', '2008R2', '2008']
+
+# how often each kind of server shows up (the rest have SQL on them)
+server_mix = {'no_sql': 0.55, 'warning': 0.04, 'blank': 0.03}
+
+# how many of the servers with SQL have each version - newer versions are more common
+family_weights = {'2019': 10, '2017': 25, '2016': 25, '2014': 18, '2012': 12, '2008R2': 6, '2008': 4}
+
+editions = ['Standard Edition (64-bit)', 'Enterprise Edition (64-bit)', 'Enterprise Edition: Core-based Licensing (64-bit)',
+            'Express Edition (64-bit)', 'Developer Edition (64-bit)', 'Web Edition (64-bit)']
+
+
+def write_catalog_fixtures(directory, pages=default_pages):
+    # reads every saved webpage in pages the same way a real run reads sqlserverbuilds, and writes it into directory
+    # in the catalog cache format, as if it came from the real page
+    import json
+    import pathlib
+    from parseOutputOfPowerShellSCCM import sqlserverbuilds_url, sql_versions, fetch_catalog
+
+    os.makedirs(directory, exist_ok=True)
+    pages_url = pathlib.Path(pages).resolve().as_uri()
+    for release_type, family, webpage in sql_versions:
+        if release_type not in catalog_release_types:
+            continue
+        columns = fetch_catalog(pages_url + webpage)
+        with open(os.path.join(directory, release_type + '.json'), 'w') as fixture:
+            # fetched is 0 so these are always "stale" - use them with --offline
+            json.dump({'url': sqlserverbuilds_url + webpage, 'fetched': 0, 'columns': columns}, fixture, indent=0)
+            fixture.write('\n')
+
+
+def catalog_builds(catalogs=default_catalogs):
+    # SQL version -> [(build, product level)] of every build in the catalog fixtures, newest first like the webpages
+    # (the product level is the service pack the build belongs to, worked out the same way as for real servers)
+    from parseOutputOfPowerShellSCCM import load_catalog_set, branch_status
+
+    catalog_set = load_catalog_set(catalog_release_types, catalogs, offline=True)
+    builds = {}
+    for release_type in catalog_release_types:
+        index = catalog_set.indexes[release_type]
+        builds[release_type] = [('.'.join(str(part) for part in build), branch_status(index, build)[0])
+                                for build in reversed(index.sorted_builds)]
+    return builds
+
+
+def server_block(name, kind, edition='', build='', level='', compact=False):
+    # one server in the SCCM script output, exactly like SCCM prints it
+    # (compact is the output of getMSSQLVersioninSCCM.ps1 -Compact)
+    if kind == 'blank':
+        return name + '\t1\t0\n'
+    if compact:
+        return compact_server_line(name, kind, edition, build, level)
+    if kind == 'warning':
+        return (name + '\t1\t0\tWARNING: Could not obtain SQL Server Service information. An attempt to connect to WMI on "' +
+                name + '" failed, access denied. [  "Did SQL Query Run? : False",  "Result of Query:" ]\n')
+    if kind == 'no_sql':
+        return name + '\t1\t0\t[\n  "Did SQL Query Run? : False",\n  "Result of Query:"\n]\n'
+    block = name + '\t1\t0\t[\n  "Did SQL Query Run? : True",\n  "Result of Query:",\n'
+    block += '  {\n    "Result": "' + edition + '",\n    "Query": "Edition"\n  },\n'
+    block += '  {\n    "Result": "' + build + '",\n    "Query": "Product Version"\n  },\n'
+    block += '  {\n    "Result": "' + level + '",\n    "Query": "Product Level"\n  }\n]\n'
+    return block
+
+
+def compact_server_line(name, kind, edition='', build='', level=''):
+    # one server in the -Compact output: MSSQLv1|instance|query ran|edition|product version|product level|error
+    if kind == 'warning':
+        return (name + '\t1\t0\tWARNING: Could not obtain SQL Server Service information. An attempt to connect to WMI on "' +
+                name + '" failed, access denied. MSSQLv1|MSSQLSERVER|False||||The term Invoke-SqlCmd is not recognized\n')
+    if kind == 'no_sql':
+        return name + '\t1\t0\tMSSQLv1|MSSQLSERVER|False||||A network-related or instance-specific error occurred\n'
+    return name + '\t1\t0\tMSSQLv1|MSSQLSERVER|True|' + edition + '|' + build + '|' + level + '|\n'
+
+
+def write_sccm_output(filename, servers, seed=1, compact=False, catalogs=default_catalogs):
+    # a fake SCCM output file with this many servers - the same seed always makes the same file
+    # (with compact, the same servers as the -Compact output of the PowerShell script)
+    import random
+
+    generator = random.Random(seed)
+
+    # every build a server could have: (build, product level)
+    builds = catalog_builds(catalogs)
+    release_types = list(family_weights)
+    weights = [family_weights[release_type] for release_type in release_types]
+
+    kinds = list(server_mix) + ['sql']
+    kind_weights = list(server_mix.values()) + [1 - sum(server_mix.values())]
+
+    with open(filename, 'w', buffering=1 << 20) as output:
+        for number in range(1, servers + 1):
+            name = 'SERVER' + str(number)
+            kind = generator.choices(kinds, kind_weights)[0]
+            if kind == 'sql':
+                release_type = generator.choices(release_types, weights)[0]
+                # most servers are a few updates behind the newest build of their version
+                family_builds = builds[release_type]
+                build, level = family_builds[min(len(family_builds) - 1, int(generator.expovariate(0.15)))]
+                output.write(server_block(name, kind, generator.choice(editions), build, level, compact))
+            else:
+                output.write(server_block(name, kind, compact=compact))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Make fake SCCM script output and sqlserverbuilds catalog fixtures for testing.')
+    parser.add_argument('servers', nargs='?', type=int, help='how many servers to put in the output file')
+    parser.add_argument('output', nargs='?', default='SSCM TEXTFILE HERE.txt', help='the output file (default "SSCM TEXTFILE HERE.txt")')
+    parser.add_argument('--seed', type=int, default=1, help='random seed, the same seed always makes the same file (default 1)')
+    parser.add_argument('--compact', action='store_true',
+                        help='write the output of the PowerShell script run with -Compact (one line per server)')
+    parser.add_argument('--catalogs', metavar='DIRECTORY', default=None,
+                        help='also write the catalog fixtures into DIRECTORY from the saved webpages in --pages '
+                             '(use it with --cache-dir DIRECTORY --offline)')
+    parser.add_argument('--pages', metavar='DIRECTORY', default=default_pages,
+                        help='the saved sqlserverbuilds webpages (default samples/pages)')
+    args = parser.parse_args()
+
+    if args.servers is None and args.catalogs is None:
+        parser.error('give a number of servers, --catalogs DIRECTORY, or both')
+    if args.catalogs is not None:
+        write_catalog_fixtures(args.catalogs, args.pages)
+    if args.servers is not None:
+        write_sccm_output(args.output, args.servers, args.seed, args.compact, args.catalogs or default_catalogs)
@@ -1,27 +1,108 @@
+Param(
+	# one short line per SQL Server instance instead of the full query results - about 5 times smaller
+	# for the same servers, and parseOutputOfPowerShellSCCM.py reads both
+	[switch]$Compact,
+	# how long to wait for each instance before giving up on it - the instances are all queried at the same
+	# time, so a server with a lot of them still finishes well within the SCCM script timeout
+	[int]$TimeoutSeconds = 15
+)
+
+# every SQL Server instance installed on this server (the default instance is MSSQLSERVER)
+$Instances = @()
 Try
 {
-	# To wipe out previous results
-	$Results = $null
+	$Instances = @((Get-Item -Path 'HKLM:\SOFTWARE\Microsoft\Microsoft SQL Server\Instance Names\SQL' -ErrorAction Stop).GetValueNames())
+}
+Catch
+{
+	# no SQL Server installed, or the registry can't be read - try the default instance anyway like before
+}
+if ($Instances.Count -eq 0)
+{
+	$Instances = @('MSSQLSERVER')
+}
+
+# asks one instance for its version
+$QueryInstance = {
+	Param($Instance, $TimeoutSeconds)
 
-	$Results = Invoke-SqlCmd -query `
-	"SELECT 'Edition', SERVERPROPERTY('Edition'); 
-	 SELECT 'Product Version', SERVERPROPERTY('ProductVersion');
-	 SELECT 'Product Level', SERVERPROPERTY('ProductLevel');" `
-	-ServerInstance "localhost" | Select-Object -Property Column1, @{label = 'Result'; expression = { $_.Column2}} `
-								| Select-Object -Property Result, @{label = 'Query'; expression = { $_.Column1}}
-	
-	# query properly executed
-	$SQLQuerySuccess = $TRUE
+	if ($Instance -eq 'MSSQLSERVER') { $ServerInstance = "localhost" } else { $ServerInstance = "localhost\$Instance" }
+	Try
+	{
+		$Results = Invoke-SqlCmd -query `
+		"SELECT 'Edition', SERVERPROPERTY('Edition');
+		 SELECT 'Product Version', SERVERPROPERTY('ProductVersion');
+		 SELECT 'Product Level', SERVERPROPERTY('ProductLevel');" `
+		-ServerInstance $ServerInstance -ConnectionTimeout $TimeoutSeconds -QueryTimeout $TimeoutSeconds -ErrorAction Stop `
+									| Select-Object -Property Column1, @{label = 'Result'; expression = { $_.Column2}} `
+									| Select-Object -Property Result, @{label = 'Query'; expression = { $_.Column1}}
 
+		# query properly executed
+		[PSCustomObject]@{ Instance = $Instance; SQLQuerySuccess = $TRUE; Results = $Results; ErrorText = "" }
+	}
+	Catch
+	{
+		# query did not properly execute :(
+		# SQL probably doesn't exist on this server, or you have inadequate access rights, etc
+		[PSCustomObject]@{ Instance = $Instance; SQLQuerySuccess = $FALSE; Results = $null; ErrorText = $_.Exception.Message }
+	}
 }
-Catch
+
+# query all the instances at the same time, each in its own runspace
+$Pool = [RunspaceFactory]::CreateRunspacePool(1, $Instances.Count)
+$Pool.Open()
+$Queries = foreach ($Instance in $Instances)
 {
-	# query did not properly execute :(
-	# SQL probably doesn't exist on this server, or you have inadequate access rights, etc
-	$SQLQuerySuccess = $FALSE
+	$PowerShell = [PowerShell]::Create().AddScript($QueryInstance).AddArgument($Instance).AddArgument($TimeoutSeconds)
+	$PowerShell.RunspacePool = $Pool
+	[PSCustomObject]@{ Instance = $Instance; PowerShell = $PowerShell; Handle = $PowerShell.BeginInvoke() }
 }
 
-# output of results
-"Did SQL Query Run? : $SQLQuerySuccess"
-"Result of Query:" 
-$Results 
+# they all started together, so they all share one deadline (with a few extra seconds for loading the SqlServer module)
+$Deadline = (Get-Date).AddSeconds($TimeoutSeconds + 10)
+$Answers = foreach ($Query in $Queries)
+{
+	$Remaining = [Math]::Max(0, [int]($Deadline - (Get-Date)).TotalMilliseconds)
+	if ($Query.Handle.AsyncWaitHandle.WaitOne($Remaining))
+	{
+		$Output = $Query.PowerShell.EndInvoke($Query.Handle)
+		# warnings from Invoke-SqlCmd (like "Could not obtain SQL Server Service information") stay in the runspace -
+		# write them out again so they still show up in the SCCM output in front of the results
+		$Query.PowerShell.Streams.Warning | ForEach-Object { Write-Warning $_.Message }
+		$Query.PowerShell.Dispose()
+		$Output
+	}
+	else
+	{
+		# don't wait for it to stop either
+		$Query.PowerShell.BeginStop($null, $null) | Out-Null
+		[PSCustomObject]@{ Instance = $Query.Instance; SQLQuerySuccess = $FALSE; Results = $null; ErrorText = "no answer within $TimeoutSeconds seconds" }
+	}
+}
+$Pool.BeginClose($null, $null) | Out-Null
+
+# output of results, one instance after another
+foreach ($Answer in $Answers)
+{
+	if ($Compact)
+	{
+		# MSSQLv1|instance|query ran|edition|product version|product level|error
+		# (| " and line breaks are taken out of the values so they can't break up the line)
+		$Values = @{}
+		foreach ($Row in $Answer.Results) { $Values[$Row.Query] = $Row.Result }
+		$Fields = @('MSSQLv1', $Answer.Instance, $Answer.SQLQuerySuccess, $Values['Edition'], $Values['Product Version'], $Values['Product Level'], $Answer.ErrorText)
+		($Fields | ForEach-Object { "$_" -replace '[|"\r\n]', ' ' }) -join '|'
+	}
+	else
+	{
+		"SQL Instance : $($Answer.Instance)"
+		"Did SQL Query Run? : $($Answer.SQLQuerySuccess)"
+		if ($Answer.ErrorText)
+		{
+			# why the query didn't run - only for reading the output, the parser skips it
+			"Error : $($Answer.ErrorText -replace '[\r\n]+', ' ')"
+		}
+		"Result of Query:"
+		$Answer.Results
+	}
+}
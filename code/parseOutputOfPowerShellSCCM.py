@@ -1,9 +1,15 @@
 ''' 
 READ THIS: in the program, where it says "SSCM TEXTFILE HERE.txt" insert the name of your text 
-file, like "sccmOutput.txt". It's at the beginning of the program.
+file, like "sccmOutput.txt". It's at the beginning of the program. Or give the file names on the 
+command line instead (more than one is fine, servers in more than one file are only reported once).
+Output of the PowerShell script run with -Compact (one short line per server) is read the same way.
+
+It can also be imported by other Python programs - run(input_files, output_directory) does everything
+without the command line and returns the results, and parse_sccm_file, load_catalog_set, enrich_records
+and write_report are the separate steps. pandas and numpy are only loaded by the steps that need them.
 
 program parses the output of the PowerShell script, creating a new folder (directory)
-with a CSV file containing six columns, a CSV containig twelve columns, and a text file 
+with a CSV file containing six columns, a CSV containig thirteen columns, and a text file 
 including information about the servers and their versions
 
     Directory structure:
@@ -16,7 +22,7 @@ including information about the servers and their versions
             |   txtfilename
 
     CSV file 1: (includes all servers scanned)
-    (1)server name
+    (1)server name (SERVER\INSTANCE for a named SQL Server instance)
     (2)whether query ran or not (only runs if there is MSSQL on the server)
     if it ran:
         (3)SQL Edition
@@ -25,7 +31,7 @@ including information about the servers and their versions
     (6)notes (warnings,etc.)
     
     CSV file 2: (only includes the servers scanned that had MSSQL)
-    (1)server name
+    (1)server name (SERVER\INSTANCE for a named SQL Server instance)
     (2)whether query ran or not
     if it ran:
         (3)SQL Edition
@@ -35,9 +41,11 @@ including information about the servers and their versions
         (7)if the last update is no more than 2 months old
         (8)Update Available
         (9)Last Update's Release Date
-        (10)Security Updated Needed (still working on it)
+        (10)Security Update Needed (the KB of the newest security update if there's one newer than the installed build, otherwise False)
         (11)New Service Pack Available
-    (12)notes (warnings,etc.)
+        (12)Cumulative Updates Behind (how many CUs for that SQL version are newer than the installed build)
+        (13)Latest CU For Service Pack (the newest CU of the service pack the installed build is on, empty if it has none)
+    (14)notes (warnings,etc.)
     
     Text file:
     ~ from initial parsing of the text file created by running the PowerShell script ~
@@ -51,29 +59,31 @@ including information about the servers and their versions
     Number of servers with uninstalled updates that are between 1 year and 2 years old
     Number of servers with uninstalled updates that are more than 2 years old
     Number of servers with an out-of-date service pack
+    Number of servers missing a security update
     Versions of Microsoft SQL Server that the servers had (like 2012, 2014, 2016)
         
 '''
 
-def main():
+# one parsed server from the SCCM script output
+# query_ran is True/False from "Did SQL Query Run?", or None when the script gave blank output
+import collections
+import contextlib
+import re
+ServerRecord = collections.namedtuple('ServerRecord',
+                                      ['server', 'query_ran', 'edition', 'product_version', 'product_level', 'warning'])
 
-    import pandas as pd
 
-    import csv
-
-    import re
-    product_version_regex = re.compile("[0-9\.]+")
-    product_level_regex = re.compile("[0-9A-Z]{2,5}")
-    
+def main(input_files=None, offline=False, refresh_catalogs=False, cache_ttl_hours=24, cache_dir=None,
+         catalog_url=None, catalog_timeout=30, catalog_retries=3, current_within_months=2, staleness_buckets=(6, 12, 24),
+         workers=1, use_mmap=False, incremental=False, state_file=None,
+         history=False, history_db=None, per_input_reports=False, profile_file=None, profile_with=None,
+         output_directory=None, parse_only=False, catalog_snapshot=None, columnar=None):
 
     # to ensure unique directory and file names for every execution of this parsing program
     from datetime import datetime
     time = datetime.now()
     # directory name
     time_directory = time.strftime("%m-%d-%Y-%H-%M-%S") 
-    # filename
-    csvname = 'allScannedServers.csv'
-    txtname = 'SQLVersionOutputStats.txt'
 
     from os.path import expanduser
     home = expanduser("~")
@@ -82,507 +92,424 @@ def main():
     import os
     #this is the directory the folder will be made in
     current_directory = home
-    final_directory = os.path.join(current_directory,time_directory)
     
     # change "time_directory" to "test_directory" or something for testing to avoid making many directories
-    final_directory = os.path.join(current_directory,time_directory) 
-    
-    if not os.path.exists(final_directory): 
-       os.makedirs(final_directory)
-
-    # change the directory so txt and csv files are created in it
-    os.chdir(final_directory)
-
-    # change csvname to constant like "csvfile.csv" or something when testing/debugging to avoid many different files
-    with open(csvname,'w') as file: 
-
-        try:
-            # open PowerShell script output in the directory where it is
-            os.chdir(home)
-            with open('SSCM TEXTFILE HERE.txt', 'r') as reader:
-
-                # change back to new directory
-                os.chdir(final_directory)
-
-                # Header of CSV File
-                file.write('Server,Did SQL Query Run?,Edition,Product Version,Product Level,Curr_Version Release Date,')
-                file.write('Updates Current Within Two Months,Update Available,Last Update Release Date,')
-                file.write('Security Update Needed,New Service Pack Available,Other')
-                file.write('\n')
-
-                # the line with the server name always contains a 1 and a 0 separated by a tab
-                contains_server_name = "1	0"
-
-                # counters for the text file statistics
-                server_count = 0
-                has_sql_count = 0
-                not_with_sql_count = 0
-                gave_warning = 0
-                didnot_run = 0
-
-                for line in reader:
-
-                    # server name
-                    if line.find(contains_server_name) != -1:
-                        server_name = line.split()[0]
-                        file.write(server_name + ",")
-                        server_count = server_count + 1
-                        # sometimes PowerShell script will fail entirely, and 
-                        # there will not even be "Did SQL Query Run?" output
-                        if line.find("[") == -1: 
-                            file.write('Blank output - issue running query')
-                            file.write('\n')
-                            didnot_run += 1
-
-                    # checks if SQL is installed on server (will display True or False, or that there was an issue running query)
-                    if line.find("Did SQL Query Run?") != -1:
-                        if line.find("True") != -1:
-                            file.write("True,") 
-                            has_sql_count += 1
-                        # if false, might not have SQL, OR there could have been an error when querying
-                        if line.find("False") != -1:
-                            not_with_sql_count += 1
-                            if line.find("WARNING") != -1:
-                                file.write("False,,,,,,,,,,")
-                                # print the WARNING in the "other" column of csv file
-                                warning = ""
-                                temp = ""
-                                for char in line:
-                                    if temp.find(contains_server_name) != -1 and char != '[':
-                                        warning = warning + char
-                                    elif char == '[':
-                                        break
-                                    else: 
-                                        temp = temp + char
-                                warning = warning.strip() # remove whitespace from the warning
-                                file.write(warning)
-                                file.write('\n')
-                                gave_warning += 1
-                            else:
-                                file.write("False")
-                                file.write('\n')
-
-                    # SQL Edition (like "Enterprise Edition: Core-based Licensing (64-bit)" or "Standard Edition (64-bit)")
-                    if line.find('"Result": "') != -1 and line.find("Edition") != -1 and line.find(contains_server_name) == -1:
-                        temp_2 = ""
-                        edition = ""
-                        for char in line:
-                            if temp_2.find('"Result": "') == -1:
-                                temp_2 = temp_2 + char
-                            elif temp_2.find('"Result": "') != -1:
-                                if char == "\"":
-                                    break
-                                edition = edition + char
-                        file.write(edition + ',')
-                        continue
-
-                    # SQL Product Version (like "11.0.7493.4")
-                    if line.find('"Result": "') != -1 and line.find(contains_server_name) == -1:
-                        temp_3 = ""
-                        version = ""
-                        for char in line:
-                            if temp_3.find('"Result": "') == -1:
-                                temp_3 = temp_3 + char
-                            elif temp_3.find('"Result": "') != -1:
-                                if char == "\"":
-                                    break
-                                version = version + char
-                        if product_version_regex.match(version):
-                            file.write(version + ",")
-                            continue
-
-                    # SQL Product Level (like "SP2" or "RTM")
-                    if line.find('"Result": "') != -1 and line.find(contains_server_name) == -1:
-                        temp_4 = ""
-                        level = ""
-                        for char in line:
-                            if temp_4.find('"Result": "') == -1:
-                                temp_4 = temp_4 + char
-                            elif temp_4.find('"Result": "') != -1:
-                                if char == "\"":
-                                    break
-                                level = level + char
-                        if product_level_regex.match(level):
-                            file.write(level)
-                            file.write('\n')
-                            continue
-
-        except FileNotFoundError:
-            print("File does not exist - maybe you are in the wrong directory? See what print(os.getcwd()) gives you.", end=' ')
-            print("You need to be in the same directory as the output from the PowerShell script that you got from SCCM.")
-
-    # create dataframe from the csv file
-    df1 = pd.read_csv(csvname)
- 
-    # getting product version to load appropriate website into dataframe
-    sqlserver6_5regex = re.compile("^6.50.")
-    sqlserver7_0regex = re.compile("^7.0.")
-    sqlserver2000regex = re.compile("^8.0.")
-    sqlserver2005regex = re.compile("^9.0.")
-    sqlserver2008regex = re.compile("^10.0.")
-    sqlserver2008_R2regex = re.compile("^10.50.")
-    sqlserver2012regex = re.compile("^11.0.")
-    sqlserver2014regex = re.compile("^12.0.")
-    sqlserver2016regex = re.compile("^13.0.")
-    sqlserver2017regex = re.compile("^14.0.")
-    sqlserver2019regex = re.compile("^15.0.")
-    
-    # make for loop below faster, don't create same dataframe again if it's already been created
-    s6_5 = False
-    s7_0 = False
-    s2000 = False
-    s2005 = False
-    s2008 = False
-    s2008R2 = False
-    s2012 = False
-    s2014 = False
-    s2016 = False
-    s2017 = False
-    s2019 = False
-    
-    # print list of versions in the text file
-    versions_list = []
-    # dictionary (map) that will store a SQL version (like 2019, 2017, or 6_5) and the most recent update date for that version
-    update_dict = {}
-    # map storing SQL version and corresponding highest Service Pack available (only applicable to pre-2017 SQL versions)
-    sp_dict = {}
-    
-    # if this process is slow, you can put the SQL versions you have more of towards the top of this for loop
-    # for example, if you have a lot of SQL Server 2016 servers, put that elif block right after the if statement
-    for pversion in df1['Product Version']:
-        pversion = str(pversion)
-        if pversion == "nan": # server doesn't have SQL on it :)
-            continue
-        elif sqlserver2019regex.match(pversion):
-            if s2019 == True:
-                continue
-            else:
-                versions_list.append('2019')
-                sqlserver2019_webpage = 'https://sqlserverbuilds.blogspot.com/2019/01/sql-server-2019-versions.html'
-                df2019 = pd.read_html(sqlserver2019_webpage)[0]
-                s2019 = True
-                update_dict['2019'] = recent_release(df2019)
-        elif sqlserver2017regex.match(pversion):
-            if s2017 == True:
-                continue
-            else:
-                versions_list.append('2017')
-                sqlserver2017_webpage = 'https://sqlserverbuilds.blogspot.com/2017/01/sql-server-2017-versions.html'
-                df2017 = pd.read_html(sqlserver2017_webpage)[0]
-                s2017 = True
-                update_dict['2017'] = recent_release(df2017)
-        elif sqlserver2016regex.match(pversion):
-            if s2016 == True:
-                continue
-            else:
-                versions_list.append('2016')
-                sqlserver2016_webpage = 'https://sqlserverbuilds.blogspot.com/2016/01/sql-server-2016-versions.html'
-                df2016 = pd.read_html(sqlserver2016_webpage)[0]
-                s2016 = True
-                update_dict['2016'] = recent_release(df2016)
-                sp_dict['2016'] = highest_sp(df2016)
-        elif sqlserver2014regex.match(pversion):
-            if s2014 == True:
-                continue
-            else:
-                versions_list.append('2014')
-                sqlserver2014_webpage = 'https://sqlserverbuilds.blogspot.com/2014/01/sql-server-2014-versions.html'
-                df2014 = pd.read_html(sqlserver2014_webpage)[0]
-                s2014 = True
-                update_dict['2014'] = recent_release(df2014)
-                sp_dict['2014'] = highest_sp(df2014)
-        elif sqlserver2012regex.match(pversion):
-            if s2012 == True:
-                continue
-            else:
-                versions_list.append('2012')
-                sqlserver2012_webpage = 'https://sqlserverbuilds.blogspot.com/2012/01/sql-server-2012-versions.html'
-                df2012 = pd.read_html(sqlserver2012_webpage)[0]
-                s2012 = True
-                update_dict['2012'] = recent_release(df2012)
-                sp_dict['2012'] = highest_sp(df2012)
-        elif sqlserver2008_R2regex.match(pversion):
-            if s2008R2 == True:
-                continue
-            else:
-                versions_list.append('2008R2')
-                sqlserver2008R2_webpage = 'https://sqlserverbuilds.blogspot.com/2008/05/sql-server-2008-r2-versions.html'
-                df2008R2 = pd.read_html(sqlserver2008R2_webpage)[0]
-                s2008R2 = True
-                update_dict['2008R2'] = recent_release(df2008R2)
-                sp_dict['2008R2'] = highest_sp(df2008R2)
-        elif sqlserver2008regex.match(pversion):
-            if s2008 == True:
-                continue
-            else:
-                versions_list.append('2008')
-                sqlserver2008_webpage = 'https://sqlserverbuilds.blogspot.com/2008/01/sql-server-2008-versions.html'
-                df2008 = pd.read_html(sqlserver2008_webpage)[0]
-                s2008 = True
-                update_dict['2008'] = recent_release(df2008)
-                sp_dict['2008'] = highest_sp(df2008)
-        elif sqlserver2005regex.match(pversion):
-            if s2005 == True:
-                continue
-            else:
-                versions_list.append('2005')
-                sqlserver2005_webpage = 'https://sqlserverbuilds.blogspot.com/2005/01/sql-server-2005-versions.html'
-                df2005 = pd.read_html(sqlserver2005_webpage)[0]
-                s2005 = True
-                update_dict['2005'] = recent_release(df2005)
-                sp_dict['2005'] = highest_sp(df2005)
-        elif sqlserver2000regex.match(pversion):
-            if s2000 == True:
-                continue
-            else:
-                versions_list.append('2000')
-                sqlserver2000_webpage = 'https://sqlserverbuilds.blogspot.com/2000/01/sql-server-2000-versions.html'
-                df2000 = pd.read_html(sqlserver2000_webpage)[0]
-                s2000 = True
-                update_dict['2000'] = recent_release(df2000)
-                sp_dict['2000'] = highest_sp(df2000)
-        elif sqlserver7_0regex.match(pversion):
-            if s7_0 == True:
-                continue
-            else:
-                versions_list.append('7_0')
-                sqlserver7_0_webpage = 'https://sqlserverbuilds.blogspot.com/2007/01/sql-server-7.html'
-                df7_0 = pd.read_html(sqlserver7_0_webpage)[0]
-                s7_0 = True
-                update_dict['7_0'] = recent_release(df7_0)
-                sp_dict['7_0'] = highest_sp(df7_0)
-        elif sqlserver6_5regex.match(pversion):
-            if s6_5 == True:
-                continue
-            else:
-                versions_list.append('6_5')
-                sqlserver6_5_webpage = 'https://sqlserverbuilds.blogspot.com/2006/05/sql-server-6-5.html'
-                df6_5 = pd.read_html(sqlserver6_5_webpage)[0]
-                s6_5 = True
-                update_dict['6_5'] = '5a' # just hard-coding it, it's never going to change again
+    if output_directory is None:
+        output_directory = os.path.join(current_directory,time_directory) 
+
+    # the PowerShell script output files - by default the one in the home directory
+    if not input_files:
+        input_files = [os.path.join(home, 'SSCM TEXTFILE HERE.txt')]
+
+    try:
+        report = run(input_files, output_directory, cache_dir=cache_dir, offline=offline, refresh_catalogs=refresh_catalogs,
+                     cache_ttl_hours=cache_ttl_hours, catalog_url=catalog_url, catalog_timeout=catalog_timeout,
+                     catalog_retries=catalog_retries, current_within_months=current_within_months,
+                     staleness_buckets=staleness_buckets, workers=workers, use_mmap=use_mmap, incremental=incremental,
+                     state_file=state_file, history=history, history_db=history_db, per_input_reports=per_input_reports,
+                     profile_file=profile_file, profile_with=profile_with, parse_only=parse_only,
+                     catalog_snapshot=catalog_snapshot, columnar=columnar)
+    except FileNotFoundError as error:
+        if error.filename is None:
+            # not a missing input file - like --offline without a cached copy of a builds page, the message says what to do
+            print(error)
         else:
-            print('Something went wrong. SQL version "' + pversion + '" did not match a regular expression that lists a webpage for that version.', end='')
-            print('At the time this program was written, it covered SQL Server versions 6.5 (6.50.___) through 2019 (15.0.____.__)', end='')
-            print('If your version is out of that range, go to https://sqlserverbuilds.blogspot.com and add that page to be supported by this program.')
+            print("File does not exist (" + str(error.filename) + ") - maybe you are in the wrong directory? See what print(os.getcwd()) gives you.", end=' ')
+            print("You need to be in the same directory as the output from the PowerShell script that you got from SCCM.")
+        raise SystemExit(1)
+    except ImportError as error:
+        # a compressed file or --columnar that needs a package that isn't installed
+        print(error)
+        raise SystemExit(1)
+    except CatalogSnapshotError as error:
+        print(error)
+        raise SystemExit(1)
+
+    if parse_only:
+        counts = report['counts']
+        print(str(counts['servers']) + ' servers scanned, ' + str(counts['has_sql']) + ' with SQL - see ' + 
+              os.path.join(output_directory, 'allScannedServers.csv'))
+        return
+
+    if incremental:
+        print('Reused the results of ' + str(report['reused']) + ' unchanged server' + ('' if report['reused']==1 else 's') + ' from the last run')
+
+    twomonthsout = report['stats']['not_current']
             
     
-    
-    # get version information about each instance of SQL Server on the servers in the csv file
-    
-    csv_row_counter = -1
-        
-    with open(csvname,'r') as parsed_csv: # read and write to the file
-        
-        # skip the line with the headers in the csv file
-        first_line = parsed_csv.readline()
-        
-        # more counters for text file statistics
-        outofdate_sp = 0
-        notupdatedin6mon= 0
-        notupdatedin1year = 0
-        notupdatedin2years = 0
-        twomonthsout = 0
+    if twomonthsout == 1:
+        pluralornot = " server"
+    else:
+        pluralornot = " servers"
         
-        # new csv file that we will write to 
-        with open('serversWithMSSQL.csv','w+') as finalcsv:
-            
-            finalcsv.write(first_line) 
-       
-            # iterate through the parsed csv file and its dataframe
-            for p_version,csv_line in zip(df1['Product Version'],parsed_csv):
-                
-                # remove trailing newline from csv_line
-                csv_line = csv_line.rstrip('\n')
-
-                product_version = str(p_version)
-                csv_row_counter += 1
-
-                if product_version == "nan": # server doesn't have SQL on it :)
-                    continue
-
-                # 2019, 2017, 6_5, etc
-                release_type = ""
-
-                
-                
-                # (6) current version's date
-                # use curr_dataframe as the dataframe that corresponds to the webpage representing the product_version (like 14.0.3294.2)  
-                if sqlserver2019regex.match(product_version):
-                    curr_dataframe = df2019
-                    release_type = '2019'
-                elif sqlserver2017regex.match(product_version):
-                    curr_dataframe = df2017
-                    release_type = '2017'
-                elif sqlserver2016regex.match(product_version):
-                    curr_dataframe = df2016  
-                    release_type = '2016'
-                elif sqlserver2014regex.match(product_version):
-                    curr_dataframe = df2014
-                    release_type = '2014'
-                elif sqlserver2012regex.match(product_version):
-                    curr_dataframe = df2012
-                    release_type = '2012'
-                elif sqlserver2008_R2regex.match(product_version):
-                    curr_dataframe = df2008R2
-                    release_type = '2008R2'
-                elif sqlserver2008regex.match(product_version):
-                    curr_dataframe = df2008
-                    release_type = '2008'
-                elif sqlserver2005regex.match(product_version):
-                    curr_dataframe = df2005
-                    release_type = '2005'
-                elif sqlserver2000regex.match(product_version):
-                    curr_dataframe = df2000
-                    release_type = '2000'
-                elif sqlserver7_0regex.match(product_version):
-                    curr_dataframe = df7_0
-                    release_type = '7_0'
-                elif sqlserver6_5regex.match(product_version):
-                    curr_dataframe = df6_5
-                    release_type = '6_5'
-                else:
-                    print('Something went wrong. SQL version "' + product_version + '" did not match a regular expression that lists a dataframe for that version.', end='')
-                    print('At the time this program was written, it covered SQL Server versions 6.5 (6.50.___) through 2019 (15.0.____.__)', end='')
-                    print('If your version is out of that range, go to https://sqlserverbuilds.blogspot.com and add that page to be supported by this program.')
-                    break
-
-                # once correct row containing the version is found, need to get "Release Date" from same row
-                html_row_counter = -1
-                # make sure the version is present in the webpage
-                bool_found = False 
-
-                for version in curr_dataframe['Build']:
-                    html_row_counter += 1
-                    if version==product_version:
-                        curr_version_date = curr_dataframe['Release Date'][html_row_counter].split()
-                        curr_version_date = curr_version_date[0]
-                        csv_line = csv_line + ',' + curr_version_date # add to csv file with comma
-                        bool_found = True
-                        break
-                if bool_found == False: # version was not found in webpage for some reason
-                    csv_line = csv_line + ','
-                    print('There was a problem - the version ' + product_version + ' was not found on the webpage')
-
-                    
+    
 
-                # (7) updates current within two months?
-                # got from https://gist.github.com/amalgjose/c767a4846d6ecaa3b6d7
-                last_release_date = ""
+#     import smtplib
+#     from email.message import EmailMessage
 
-                for i in update_dict:
-                    if i==release_type:
-                        last_release_date = update_dict[i]
-                        break
 
-                from datetime import datetime
-                from dateutil import relativedelta
+#     message = """
+# Hello, this is the automated bi-weekly SQL Server update. (alright, it's not exactly automated yet, but we're getting there!)
+# There are """ + str(twomonthsout) + pluralornot + """ with updates pending that are two months or older.
 
-                # current version's release date
-                split_version_date = curr_version_date.split('-')
+# The first CSV file attached contains information about the SQL Version on specific servers, and the second includes all servers
+# scanned but with little information about SQL Version.
+# The text file attached has some simple statistics about the number of servers with SQL, and the SQL Versions present on servers.
 
-                date_1Year = int(split_version_date[0])
-                date_1Month = int(split_version_date[1])
-                date_1Day = int(split_version_date[2])
+# """
+    
 
-                date_1 = datetime(date_1Year,date_1Month,date_1Day)
+#     email = EmailMessage()
+#     email["From"] = ''
+#     email["Subject"] = "SQL Server Version Updatesssss"
+#     email["To"] = [''] 
+#     email.set_content(message)
+#     with open(os.path.join(output_directory,'serversWithMSSQL.csv'),'rb') as content_file:
+#         content = content_file.read()
+#         email.add_attachment(content,maintype='csv',subtype='csv',filename='serversWithMSSQL.csv')
+#     with open(os.path.join(output_directory,'MSSQLoutputStats'),'rb') as text_file:
+#         content2 = text_file.read()
+#         email.add_attachment(content2,maintype='txt',subtype='txt',filename='SQLstats.txt')
+#     with open(os.path.join(output_directory,'allScannedServers.csv'),'rb') as csv_file:
+#         content3 = csv_file.read()
+#         email.add_attachment(content3,maintype='csv',subtype='csv',filename='allScannedServers.csv')
 
-                # new version's release date
-                split_version_date2 = last_release_date.split('-')
+#     smtpObj = smtplib.SMTP('insert mail server here')
+#     smtpObj.send_message(email)         
+#     print("Successfully sent email with SQL Server information")
+         
+        
+       
+        
+def run(input_files, output_directory, cache_dir=None, offline=False, refresh_catalogs=False, cache_ttl_hours=24,
+        catalog_url=None, catalog_timeout=30, catalog_retries=3, current_within_months=2, staleness_buckets=(6, 12, 24),
+        workers=1, use_mmap=False, incremental=False, state_file=None, history=False, history_db=None,
+        per_input_reports=False, profile_file=None, profile_with=None, parse_only=False, catalog_snapshot=None, columnar=None):
+    # the whole program without the command line: parses input_files (file names, wildcards are fine) and writes
+    # the reports into output_directory, then returns write_report's results plus 'records', 'counts' and 'input_files'
+    # with parse_only, only allScannedServers.csv is written and only 'records', 'counts' and 'input_files' are returned
+    # (the sqlserverbuilds pages, pandas and numpy are never loaded)
+    # columnar is the write_columnar formats to also write the results in, like ('arrow', 'parquet')
+    # raises FileNotFoundError when an input file doesn't exist (or no file matches the wildcards), and ImportError when
+    # columnar needs pyarrow
+    # nothing depends on the current directory, so it's fine to call from other programs
+    import os
+    from datetime import datetime
+    time = datetime.now()
 
-                date_2Year = int(split_version_date2[0])
-                date_2Month = int(split_version_date2[1])
-                date_2Day = int(split_version_date2[2])
+    # the sqlserverbuilds tables are kept here between runs so we don't download them every time
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    # and what every server looked like last run, for incremental runs
+    if state_file is None:
+        state_file = default_state_file()
+    # and every run's results, with history
+    if history_db is None:
+        history_db = default_history_db()
+
+    if isinstance(input_files, str):
+        input_files = [input_files]
+    patterns = input_files
+    input_files = expand_input_files(patterns)
+    if not input_files:
+        # every wildcard matched nothing - same as a missing file, and before the output folder is made
+        import errno
+        raise FileNotFoundError(errno.ENOENT, 'No input files', ', '.join(patterns))
+
+    # find out pyarrow is missing now, not after all the work
+    if columnar:
+        import_pyarrow()
+
+    if not os.path.exists(output_directory): 
+       os.makedirs(output_directory)
+
+    # with profile_file, how long every phase took goes into a JSON file at the end
+    run_profile = start_profile(profile_with) if profile_file else None
+
+    with profile_phase(run_profile, 'parse') as phase:
+        parsed = parse_sccm_files(input_files, workers, use_mmap)
+        phase['records'] = sum(len(input_records) for input_records, input_counts in parsed)
+        phase['bytes_read'] = sum(os.path.getsize(filename) for filename in input_files)
+
+    # servers that show up in more than one collection are only reported once
+    if len(parsed) == 1:
+        records, counts = parsed[0]
+    else:
+        records, duplicates = merge_records([input_records for input_records, input_counts in parsed])
+        counts = count_records(records)
+        print('Merged ' + str(len(input_files)) + ' files: ' + str(counts['servers']) + ' servers (' + 
+              str(duplicates) + ' found in more than one file)')
+
+    if parse_only:
+        with profile_phase(run_profile, 'report') as phase:
+            written = [os.path.join(output_directory, 'allScannedServers.csv')]
+            write_csv(written[0], (all_servers_row(record) for record in records))
+            if columnar:
+                written += write_columnar(output_directory, records, formats=columnar)
+            phase['records'] = len(records)
+        if run_profile is not None:
+            run_profile['counters'].update({'servers': counts['servers'], 'input_files': len(input_files),
+                                            'bytes_read': sum(os.path.getsize(filename) for filename in input_files),
+                                            'bytes_written': sum(os.path.getsize(filename) for filename in written)})
+            finish_profile(run_profile, profile_file)
+        return {'records': records, 'counts': counts, 'input_files': input_files}
+
+    # one set of webpages for every file
+    catalog_set = load_catalog_set(release_types_in(records), cache_dir, cache_ttl_hours=cache_ttl_hours, offline=offline,
+                                   refresh=refresh_catalogs, catalog_url=catalog_url, timeout=catalog_timeout,
+                                   retries=catalog_retries, run_profile=run_profile, snapshot=catalog_snapshot)
+
+    # with incremental, servers that look exactly the same as last run reuse last run's results
+    previous_state = load_state(state_file) if incremental else None
+
+    report = write_report(output_directory, records, counts, catalog_set, current_within_months=current_within_months,
+                          staleness_buckets=staleness_buckets, previous_state=previous_state, run_profile=run_profile,
+                          columnar=columnar)
+    # only the files this run wrote count for bytes_written, not whatever else is in the output folder
+    written = list(report['files'])
+
+    # the same three files for each input file on its own, in a folder named after the file
+    if per_input_reports and len(input_files) > 1:
+        for filename, (input_records, input_counts) in zip(input_files, parsed):
+            input_report = write_report(os.path.join(output_directory, report_directory_name(filename, input_files)),
+                                        input_records, input_counts, catalog_set, current_within_months=current_within_months,
+                                        staleness_buckets=staleness_buckets, run_profile=run_profile, columnar=columnar)
+            written += input_report['files']
+
+    if incremental:
+        with profile_phase(run_profile, 'incremental_state'):
+            written.append(os.path.join(output_directory, 'changesSinceLastRun.csv'))
+            write_changes_csv(written[-1], previous_state, report['state'])
+            save_state(state_file, report['state'])
+
+    # keep this run in the history database, for looking at trends later
+    if history:
+        with profile_phase(run_profile, 'history') as phase:
+            record_history(history_db, time.strftime("%Y-%m-%d %H:%M:%S"), report['stats'], report['sql_rows'],
+                           report['release_types'], report['months_behind'], report['known'])
+            phase['records'] = len(report['sql_rows'])
+
+    if run_profile is not None:
+        run_profile['counters'].update({'servers': counts['servers'], 'servers_with_sql': len(report['sql_rows']),
+                                        'servers_reused': report['reused'], 'input_files': len(input_files),
+                                        'bytes_read': sum(os.path.getsize(filename) for filename in input_files),
+                                        'bytes_written': sum(os.path.getsize(filename) for filename in written)})
+        finish_profile(run_profile, profile_file)
+
+    report.update({'records': records, 'counts': counts, 'input_files': input_files})
+    return report
+
+
+def default_cache_dir():
+    import os
+    return os.path.join(os.path.expanduser("~"), '.mssql-version-sccm', 'catalogs')
 
-                date_2 = datetime(date_2Year,date_2Month,date_2Day)
 
-                difference = relativedelta.relativedelta(date_2,date_1)
+def default_state_file():
+    import os
+    return os.path.join(os.path.expanduser("~"), '.mssql-version-sccm', 'state.json')
 
-                # can change this block if you want to check if "Updates Current Within" different timeframe
-                if difference.months < 2 and difference.years == 0:
-                    csv_line = csv_line + ',' + 'True'
-                else:
-                    csv_line = csv_line + ',' + 'False'
-                    twomonthsout += 1
-                    
-                # updating counters for text file statistics
-                if difference.months >= 6 and difference.years == 0: # between 6 months and 1 year
-                    notupdatedin6mon += 1
-                    
-                if difference.years == 1: # between 1 year and 2 years 
-                    notupdatedin1year += 1
-            
-                if difference.years >= 2: # 2 years or greater
-                    notupdatedin2years += 1
 
+def recent_release(index):
+    # most recent version update date ("2020-05-28") - will be printed to csv file later
+    # the newest release date of any build on the webpage, so it doesn't depend on the page marking a row "*new"
+    # ('' if no build has a date)
+    import re
+    release_date_regex = re.compile("^[0-9]{4}-[0-9]{2}-[0-9]{2}$")
+    return max((info.release_date for info in index.builds.values() if release_date_regex.match(info.release_date)), default='')
 
-                    
-                # (8) update available 
-                if(last_release_date != curr_version_date):
-                    csv_line = csv_line + ',' + 'True'
-                else:
-                    csv_line = csv_line + ',' + 'False'
 
+def write_report(output_directory, records, counts, catalog_set, current_within_months=2, staleness_buckets=(6, 12, 24),
+                 previous_state=None, run_profile=None, columnar=None):
+    # writes allScannedServers.csv, serversWithMSSQL.csv and MSSQLoutputStats for a list of ServerRecords into
+    # output_directory, and returns the enrich_records results plus the counters in MSSQLoutputStats as 'stats'
+    # and the names of the files it wrote as 'files'
+    # columnar is the write_columnar formats to also write the results in, like ('arrow', 'parquet')
+    import os
 
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    # csv file with every server, written in one go
+    with profile_phase(run_profile, 'report') as phase:
+        write_csv(os.path.join(output_directory, 'allScannedServers.csv'), (all_servers_row(record) for record in records))
+        phase['records'] = phase.get('records', 0) + len(records)
+
+    with profile_phase(run_profile, 'enrich') as phase:
+        enriched = enrich_records(records, catalog_set, current_within_months=current_within_months,
+                                  staleness_buckets=staleness_buckets, previous_state=previous_state)
+        phase['records'] = phase.get('records', 0) + len(enriched['sql_rows'])
+        phase['distinct_builds'] = phase.get('distinct_builds', 0) + enriched['distinct_builds']
+        phase['build_cache_hits'] = phase.get('build_cache_hits', 0) + enriched['build_cache_hits']
+
+    with profile_phase(run_profile, 'report'):
+        # csv file with only the servers that have SQL, also written in one go
+        write_csv(os.path.join(output_directory, 'serversWithMSSQL.csv'), enriched['sql_rows'])
+
+        run_stats = {'servers': counts['servers'], 'has_sql': counts['has_sql'], 'sql_instances': counts['sql_instances'],
+                     'not_with_sql': counts['not_with_sql'],
+                     'didnot_run': counts['didnot_run'], 'gave_warning': counts['gave_warning'], 'not_current': enriched['not_current'],
+                     'outofdate_sp': enriched['outofdate_sp'], 'security_needed': enriched['security_needed'],
+                     'staleness_buckets': list(staleness_buckets),
+                     'bucket_counts': enriched['bucket_counts']}
+        write_stats(os.path.join(output_directory, 'MSSQLoutputStats'), run_stats, enriched['versions_list'],
+                    current_within_months, staleness_buckets)
+        files = [os.path.join(output_directory, name) for name in ['allScannedServers.csv', 'serversWithMSSQL.csv', 'MSSQLoutputStats']]
+        if columnar:
+            files += write_columnar(output_directory, records, enriched=enriched, run_stats=run_stats, formats=columnar,
+                                    current_within_months=current_within_months, staleness_buckets=staleness_buckets)
+
+    enriched['stats'] = run_stats
+    enriched['files'] = files
+    return enriched
+
+
+def enrich_records(records, catalog_set, current_within_months=2, staleness_buckets=(6, 12, 24), previous_state=None):
+    # the serversWithMSSQL.csv rows for a list of ServerRecords, and what goes into the stats file:
+    #   sql_rows - the rows of serversWithMSSQL.csv, and release_types - the SQL version of each of them
+    #   months_behind, known, bucket_counts - from compute_staleness, for each row
+    #   not_current, outofdate_sp, security_needed - counters for the text file
+    #   versions_list - the SQL versions the servers had
+    #   state - what every server looked like and its results, for the next incremental run
+    #   reused - how many servers' results came from previous_state
+    #   distinct_builds, build_cache_hits - how many different (edition, version, level) there were, and how many
+    #       servers got their results from another server with the same ones
 
-                # (9) newest update release date   
-                csv_line = csv_line + ',' + last_release_date
+    # get version information about each instance of SQL Server on the servers in the csv file
+    
+    # more counters for text file statistics
+    outofdate_sp = 0
+    security_needed = 0
+    twomonthsout = 0
+
+    # rows of the second csv file, and the release dates for working out (7) once every row is done
+    sql_rows = []
+    sql_release_types = []
+    curr_dates = []
+    last_dates = []
+
+    # servers that look exactly the same as in previous_state (and whose SQL version's webpage hasn't
+    # changed) reuse those results instead of being looked up again
+    if previous_state is None:
+        previous_state = {}
+    new_state = {}
+    reused = 0
 
+    # print list of versions in the text file
+    versions_list = []
 
+    # a lot of servers have exactly the same edition, version and level, so each different one is only looked up
+    # once and the results are copied to the rest - everything in the record except the server name ->
+    # (release type, row, current version's release date, whether the service pack is out of date)
+    # release type is None for a SQL version without a webpage
+    build_results = {}
+    build_cache_hits = 0
 
-                # (10) security update stuff - need to figure this out
-                csv_line = csv_line + ','
+    for record in records:
 
+        fingerprint = record_fingerprint(record)
+        new_state[record.server] = {'fingerprint': fingerprint, 'record': list(record)}
 
+        if not record.product_version: # server doesn't have SQL on it :)
+            continue
 
-                #(11) new service pack available
-                # SQL Server 2017 and greater does not have service packs
-                if release_type >= '2017': 
-                    csv_line = csv_line + ','
-                # get highest service pack for the year's version through the sp_dict map
-                else:
-                    biggest_sp = ""
-                    curr_sp = str(df1['Product Level'][csv_row_counter])
-                    for year in sp_dict:
-                        if year==release_type:
-                            biggest_sp = sp_dict[year]
-                
-                    # compare service pack to service pack installed on server
-                    if biggest_sp != curr_sp: 
-                        outofdate_sp += 1
-                        csv_line = csv_line + ',' + biggest_sp
-                    else:
-                        csv_line = csv_line + ','
-                             
-                    
+        build_key = record[1:]
+        build_result = build_results.get(build_key)
+        if build_result is not None:
+            release_type = build_result[0]
+        else:
+            # use the build index of the webpage representing the product_version (like 14.0.3294.2)  
+            release_type = sql_release_type(record.product_version)
+            if release_type not in catalog_set.indexes:
+                release_type = None
+        if release_type is None: # already printed a message about this one
+            build_results[build_key] = (None,)
+            continue
+        if release_type not in versions_list:
+            versions_list.append(release_type)
+        last_release_date = catalog_set.last_release_dates.get(release_type, "")
+        signature = catalog_set.signatures[release_type]
+
+        previous = previous_state.get(record.server)
+        if previous and previous.get('fingerprint') == fingerprint and previous.get('catalog') == signature:
+            row = list(previous['row'])
+            curr_version_date = previous['curr_date']
+            sp_outofdate = previous['sp_outofdate']
+            reused += 1
+        elif build_result is not None:
+            row = [record.server] + build_result[1][1:]
+            curr_version_date = build_result[2]
+            sp_outofdate = build_result[3]
+            build_cache_hits += 1
+        else:
+            row, curr_version_date, sp_outofdate = enrich_record(record, release_type, catalog_set.indexes[release_type],
+                                                                 last_release_date, catalog_set.highest_sps.get(release_type, ""))
+            # a copy, (7) gets filled into row below
+            build_results[build_key] = (release_type, list(row), curr_version_date, sp_outofdate)
+
+        new_state[record.server].update({'catalog': signature, 'row': row,
+                                         'curr_date': curr_version_date, 'sp_outofdate': sp_outofdate})
+
+        # (7) updates current within two months? - filled in for every server at once after this loop
+        curr_dates.append(curr_version_date)
+        last_dates.append(last_release_date)
+
+        if sp_outofdate:
+            outofdate_sp += 1
+        if row[9] not in ('', 'False'):
+            security_needed += 1
+
+        sql_rows.append(row)
+        sql_release_types.append(release_type)
+
+    # (7) and the text file counters, for all servers at once
+    months_behind, is_current, known, bucket_counts = compute_staleness(curr_dates, last_dates, current_within_months, staleness_buckets)
+
+    for row, current, date_known in zip(sql_rows, is_current, known):
+        if not date_known:
+            row[6] = ''
+        elif current:
+            row[6] = 'True'
+        else:
+            row[6] = 'False'
+            twomonthsout += 1
 
-                finalcsv.write(csv_line)
-                finalcsv.write('\n')
+    return {'sql_rows': sql_rows, 'release_types': sql_release_types, 'months_behind': months_behind, 'known': known,
+            'bucket_counts': bucket_counts, 'not_current': twomonthsout, 'outofdate_sp': outofdate_sp,
+            'security_needed': security_needed, 'versions_list': versions_list, 'state': new_state, 'reused': reused,
+            'distinct_builds': len(build_results), 'build_cache_hits': build_cache_hits}
 
-                
 
+def write_stats(filename, run_stats, versions_list, current_within_months=2, staleness_buckets=(6, 12, 24)):
+    # the MSSQLoutputStats text file
 
-    with open('MSSQLoutputStats','w') as file2:
+    with open(filename,'w') as file2:
 
-        file2.write(str(server_count))
-        file2.write(" server" if server_count==1 else " servers")
+        file2.write(str(run_stats['servers']))
+        file2.write(" server" if run_stats['servers']==1 else " servers")
         file2.write(" scanned")
         file2.write('\n')
         file2.write("___________________") # trying to make text file a little prettier
         file2.write('\n')
         file2.write('\n')
 
-        file2.write(str(has_sql_count))
-        file2.write(" server" if has_sql_count==1 else " servers")
+        file2.write(str(run_stats['has_sql']))
+        file2.write(" server" if run_stats['has_sql']==1 else " servers")
         file2.write(" with SQL (query returned true)")
         file2.write('\n')
 
-        file2.write(str(not_with_sql_count))
-        file2.write(" server" if not_with_sql_count==1 else " servers")
+        file2.write(str(run_stats['sql_instances']))
+        file2.write(" SQL Server instance" if run_stats['sql_instances']==1 else " SQL Server instances")
+        file2.write(" on them (a server can have more than one)")
+        file2.write('\n')
+
+        file2.write(str(run_stats['not_with_sql']))
+        file2.write(" server" if run_stats['not_with_sql']==1 else " servers")
         file2.write(" without SQL (query returned false)")
         file2.write('\n')
 
-        file2.write(str(didnot_run))
-        file2.write(" server" if didnot_run==1 else " servers")
+        file2.write(str(run_stats['didnot_run']))
+        file2.write(" server" if run_stats['didnot_run']==1 else " servers")
         file2.write(" did not run query at all (neither true nor false)")
         file2.write('\n')
         file2.write('\n')
@@ -590,8 +517,8 @@ def main():
         file2.write("Other:")
         file2.write('\n')
 
-        file2.write(str(gave_warning))
-        file2.write(" server" if gave_warning==1 else " servers")
+        file2.write(str(run_stats['gave_warning']))
+        file2.write(" server" if run_stats['gave_warning']==1 else " servers")
         file2.write(" that gave WARNING (query returned false). See the 'allScannedServers' CSV file for more information.")
         file2.write('\n')
         file2.write('\n')
@@ -601,136 +528,2208 @@ def main():
         file2.write('\n')
         file2.write('\n')
         
-        file2.write(str(twomonthsout))
-        file2.write(" server" if notupdatedin6mon==1 else " servers")
-        file2.write(" with uninstalled updates that are 2 or more months old")
+        file2.write(str(run_stats['not_current']))
+        file2.write(" server" if run_stats['not_current']==1 else " servers")
+        file2.write(" with uninstalled updates that are " + str(current_within_months) + " or more months old")
         file2.write('\n')
         file2.write('\n')
         
-        file2.write(str(notupdatedin6mon))
-        file2.write(" server" if notupdatedin6mon==1 else " servers")
-        file2.write(" with uninstalled updates that are between 6 months and 1 year old")
-        file2.write('\n')
-        file2.write(str(notupdatedin1year))
-        file2.write(" server" if notupdatedin1year==1 else " servers")
-        file2.write(" with uninstalled updates that are between 1 year and 2 years old")
-        file2.write('\n')
-        file2.write(str(notupdatedin2years))
-        file2.write(" server" if notupdatedin2years==1 else " servers")
-        file2.write(" with uninstalled updates that are more than 2 years old")
-        file2.write('\n')
+        # one line for each staleness bucket (by default 6 months - 1 year, 1 year - 2 years, more than 2 years)
+        for bucket, count in enumerate(run_stats['bucket_counts']):
+            file2.write(str(count))
+            file2.write(" server" if count==1 else " servers")
+            if bucket + 1 < len(staleness_buckets):
+                file2.write(" with uninstalled updates that are between " + months_label(staleness_buckets[bucket]) + 
+                            " and " + months_label(staleness_buckets[bucket + 1]) + " old")
+            else:
+                file2.write(" with uninstalled updates that are more than " + months_label(staleness_buckets[bucket]) + " old")
+            file2.write('\n')
         file2.write('\n')
         
-        file2.write(str(outofdate_sp))
-        file2.write(" server" if outofdate_sp==1 else " servers")
+        file2.write(str(run_stats['outofdate_sp']))
+        file2.write(" server" if run_stats['outofdate_sp']==1 else " servers")
         file2.write(" with an out-of-date service pack")
         file2.write('\n')
+
+        file2.write(str(run_stats['security_needed']))
+        file2.write(" server" if run_stats['security_needed']==1 else " servers")
+        file2.write(" missing a security update")
+        file2.write('\n')
         file2.write('\n')
         
-        versions_list.sort()
+        versions_list = sorted(versions_list)
         file2.write("Scanned servers had Microsoft SQL Server Versions: ")
         file2.write('\n')
         for sql_item in versions_list:
             file2.write("    " + sql_item)
             file2.write('\n')
-            
-            
-    
-    if twomonthsout == 1:
-        pluralornot = " server"
+
+
+def release_types_in(records):
+    # every SQL version (2019, 2017, 6_5, etc.) in a list of ServerRecords, in the order they first show up
+    versions_list = []
+    for record in records:
+        if not record.product_version: # server doesn't have SQL on it :)
+            continue
+        release_type = sql_release_type(record.product_version)
+        if release_type is None:
+            print('Something went wrong. SQL version "' + record.product_version + '" is not one of the SQL versions that has a webpage listed in sql_versions.', end='')
+            print('At the time this program was written, it covered SQL Server versions 6.5 (6.50.___) through 2019 (15.0.____.__)', end='')
+            print('If your version is out of that range, go to https://sqlserverbuilds.blogspot.com and add that page to be supported by this program.')
+        elif release_type not in versions_list:
+            versions_list.append(release_type)
+    return versions_list
+
+
+# everything the reports need from the sqlserverbuilds webpages, for a list of SQL versions:
+#   release_types - the SQL versions (like '2017', '6_5')
+#   indexes - SQL version -> CatalogIndex
+#   last_release_dates - SQL version -> the most recent update date for that version
+#   highest_sps - SQL version -> highest Service Pack available ('' for SQL versions without service packs, like 2017)
+#   signatures - SQL version -> catalog_signature, for incremental runs
+#   sources - SQL version -> where the webpage came from ('cache', 'download' or 'old cache')
+CatalogSet = collections.namedtuple('CatalogSet', ['release_types', 'indexes', 'last_release_dates', 'highest_sps', 'signatures',
+                                                   'sources'])
+
+
+def load_catalog_set(release_types, cache_dir, cache_ttl_hours=24, offline=False, refresh=False,
+                     catalog_url=None, timeout=30, retries=3, run_profile=None, snapshot=None):
+    # CatalogSet for the SQL versions, with all of their webpages loaded at the same time
+    # or read from a catalog snapshot file (see write_catalog_snapshot), without touching the cache or the internet
+    if snapshot is not None:
+        with profile_phase(run_profile, 'catalog_load') as phase:
+            catalog_set = read_catalog_snapshot(snapshot, release_types)
+            phase['records'] = len(catalog_set.release_types)
+        return catalog_set
+
+    sources = {}
+    with profile_phase(run_profile, 'catalog_load') as phase:
+        catalogs = prefetch_catalogs(release_types, cache_dir, cache_ttl_hours=cache_ttl_hours, offline=offline, refresh=refresh,
+                                     catalog_url=catalog_url, timeout=timeout, retries=retries, sources=sources)
+        phase['records'] = len(catalogs)
+
+    indexes = {}
+    update_dict = {}
+    sp_dict = {}
+    signatures = {}
+    with profile_phase(run_profile, 'catalog_index') as phase:
+        for release_type in release_types:
+            indexes[release_type] = build_index(catalogs[release_type])
+            if release_type == '6_5':
+                update_dict['6_5'] = '5a' # just hard-coding it, it's never going to change again
+            else:
+                update_dict[release_type] = recent_release(indexes[release_type])
+            # SQL Server 2017 and greater does not have service packs, newest_service_pack gives '' for them
+            sp_dict[release_type] = newest_service_pack(indexes[release_type])
+            signatures[release_type] = catalog_signature(indexes[release_type], update_dict[release_type], sp_dict.get(release_type, ""))
+        phase['records'] = sum(len(catalogs[release_type]) for release_type in release_types)
+
+    if run_profile is not None:
+        run_profile['counters']['catalog_cache_hits'] = list(sources.values()).count('cache')
+        run_profile['counters']['catalog_cache_misses'] = len(sources) - run_profile['counters']['catalog_cache_hits']
+        run_profile['counters']['catalog_downloads'] = list(sources.values()).count('download')
+
+    return CatalogSet(list(release_types), indexes, update_dict, sp_dict, signatures, sources)
+
+
+# version of the catalog snapshot format written by write_catalog_snapshot - bump it when the format changes
+catalog_snapshot_format = 3
+
+
+def current_umask():
+    import os
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# permissions a new file normally gets - read once when the script starts, because reading the umask means
+# changing it for a moment, which could affect files that other threads make at the same time
+new_file_mode = 0o666 & ~current_umask()
+
+
+@contextlib.contextmanager
+def replacing_file(filename):
+    # opens a temporary file in the same folder as filename for the with block to write, then moves it over filename,
+    # so anything reading filename sees the old file or the whole new one, never half of it
+    # the temporary file gets a name of its own (mkstemp), so two runs writing the same file at once (like two
+    # watchers sharing a cache folder) don't write into each other's temporary file - the last one to finish wins
+    # if the with block fails the temporary file is removed and filename is left alone
+    import os
+    import tempfile
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(directory, exist_ok=True)
+    handle, temp_file = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(filename) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'w') as output:
+            yield output
+        # mkstemp makes the file readable by its owner only - give it the permissions the file had before,
+        # or the ones a new file would get
+        try:
+            mode = os.stat(filename).st_mode & 0o777
+        except OSError:
+            mode = new_file_mode
+        os.chmod(temp_file, mode)
+        os.replace(temp_file, filename)
+    except BaseException:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        raise
+
+
+def write_catalog_snapshot(filename, catalog_set, source=None):
+    # saves everything the program needs from the sqlserverbuilds pages of a CatalogSet into one small file,
+    # so later runs can load it in a few milliseconds without pandas or an HTML parser (see read_catalog_snapshot)
+    # for each SQL version:
+    #   builds - every build as a list of ints, smallest first (CatalogIndex.sorted_builds)
+    #   release_dates - their release dates as ints like 20200407 (0 if the webpage didn't have one)
+    #   descriptions - their KB / Description
+    #   cumulative_updates - positions in builds of the cumulative updates
+    #   security_updates, security_kbs - positions in builds of the security updates, and their KBs
+    #   branches, branch_levels, branch_latest_cus - the service pack ladder, as positions in builds (-1 for None)
+    #   other_builds - build strings that aren't just the build number (like "14.0.3294.2 " or a second spelling),
+    #                  as build string -> [release date, description]
+    #   no_build_string - positions in builds whose plain build number string wasn't on the webpage
+    #   last_release_date, highest_sp, signature - the rest of the CatalogSet
+    import json
+    import time
+
+    families = {}
+    for release_type in catalog_set.release_types:
+        index = catalog_set.indexes[release_type]
+        positions = dict((build, position) for position, build in enumerate(index.sorted_builds))
+        other_builds = {}
+        for build, info in index.builds.items():
+            parsed = parse_build(build)
+            if parsed is None or build_string(parsed) != build or index.sorted_info[positions[parsed]] != info:
+                other_builds[build] = [date_number(info.release_date), info.description]
+        families[release_type] = {
+            'builds': [list(build) for build in index.sorted_builds],
+            'release_dates': [date_number(info.release_date) for info in index.sorted_info],
+            'descriptions': [info.description for info in index.sorted_info],
+            'cumulative_updates': [positions[build] for build in index.cumulative_updates],
+            'security_updates': [positions[build] for build in index.security_updates],
+            'security_kbs': index.security_kbs,
+            'branches': [positions[build] for build in index.branches],
+            'branch_levels': index.branch_levels,
+            'branch_latest_cus': [-1 if build is None else positions[build] for build in index.branch_latest_cus],
+            'other_builds': other_builds,
+            'no_build_string': [position for position, build in enumerate(index.sorted_builds)
+                                if index.builds.get(build_string(build)) != index.sorted_info[position]],
+            'last_release_date': catalog_set.last_release_dates.get(release_type),
+            'highest_sp': catalog_set.highest_sps.get(release_type),
+            'signature': catalog_set.signatures[release_type]}
+
+    snapshot = {'format': catalog_snapshot_format, 'built': time.strftime("%Y-%m-%d %H:%M:%S"),
+                'source': source or sqlserverbuilds_url, 'families': families}
+    # write to a temporary file first so a half-written snapshot is never picked up
+    with replacing_file(filename) as output:
+        json.dump(snapshot, output, separators=(',', ':'))
+
+
+class CatalogSnapshotError(ValueError):
+    # a --catalog-snapshot file that can't be used (missing, not a snapshot, or made by another version of the program)
+    pass
+
+
+def read_catalog_snapshot(filename, release_types=None):
+    # CatalogSet from a file made by write_catalog_snapshot, with every SQL version in it (or just release_types) -
+    # a SQL version that isn't in it is left out with a message, like a version that has no webpage
+    # raises CatalogSnapshotError if the file can't be read or is from another version of this program
+    import json
+
+    try:
+        with open(filename, 'r') as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except OSError as error:
+        raise CatalogSnapshotError('Could not read the catalog snapshot ' + filename + ' (' + str(error.strerror or error) + 
+                                   ') - make it with --build-snapshot ' + filename)
+    except ValueError:
+        raise CatalogSnapshotError(filename + ' is not a catalog snapshot - make it again with --build-snapshot ' + filename)
+    if not isinstance(snapshot, dict) or snapshot.get('format') != catalog_snapshot_format:
+        raise CatalogSnapshotError(filename + ' is a version ' + str(snapshot.get('format') if isinstance(snapshot, dict) else None) + 
+                                   ' catalog snapshot, this program reads version ' + str(catalog_snapshot_format) + 
+                                   ' - build it again with --build-snapshot')
+
+    families = snapshot['families']
+    if release_types is None:
+        release_types = list(families)
+    for release_type in release_types:
+        if release_type not in families:
+            print('Something went wrong. SQL Server ' + release_type + ' is not in the catalog snapshot ' + filename + 
+                  ', so its servers are left out. Build the snapshot again with --build-snapshot (on a machine that can reach ' + 
+                  'https://sqlserverbuilds.blogspot.com) to include it.')
+    release_types = [release_type for release_type in release_types if release_type in families]
+
+    indexes = {}
+    update_dict = {}
+    sp_dict = {}
+    signatures = {}
+    sources = {}
+    for release_type in release_types:
+        family = families[release_type]
+        sorted_builds = [tuple(build) for build in family['builds']]
+        sorted_info = [BuildInfo(date_text(release_date), description)
+                       for release_date, description in zip(family['release_dates'], family['descriptions'])]
+        no_build_string = set(family['no_build_string'])
+        builds = {}
+        for position, build in enumerate(sorted_builds):
+            if position not in no_build_string:
+                builds[build_string(build)] = sorted_info[position]
+        for build, (release_date, description) in family['other_builds'].items():
+            builds[build] = BuildInfo(date_text(release_date), description)
+        cumulative_updates = [sorted_builds[position] for position in family['cumulative_updates']]
+        security_updates = [sorted_builds[position] for position in family['security_updates']]
+
+        branches = [sorted_builds[position] for position in family['branches']]
+        branch_latest_cus = [None if position == -1 else sorted_builds[position] for position in family['branch_latest_cus']]
+
+        indexes[release_type] = CatalogIndex(builds, sorted_builds, sorted_info, cumulative_updates, security_updates,
+                                             family['security_kbs'], branches, family['branch_levels'], branch_latest_cus)
+        update_dict[release_type] = family['last_release_date']
+        sp_dict[release_type] = family['highest_sp']
+        signatures[release_type] = family['signature']
+        sources[release_type] = 'snapshot'
+
+    return CatalogSet(list(release_types), indexes, update_dict, sp_dict, signatures, sources)
+
+
+def build_string(build):
+    # (14, 0, 3294, 2) -> "14.0.3294.2"
+    return '.'.join(str(part) for part in build)
+
+
+def date_number(date):
+    # "2020-04-07" -> 20200407, "" -> 0 (anything else is kept as it is)
+    if not date:
+        return 0
+    if len(date) == 10 and date[4] == '-' and date[7] == '-' and date.replace('-', '').isdigit():
+        return int(date.replace('-', ''))
+    return date
+
+
+def date_text(date):
+    # 20200407 -> "2020-04-07", 0 -> ""
+    if not isinstance(date, int):
+        return date
+    if date == 0:
+        return ''
+    date = str(date)
+    return date[:4] + '-' + date[4:6] + '-' + date[6:]
+
+
+def expand_input_files(patterns):
+    # full file names, with wildcards like "exports/*.txt" expanded (Windows doesn't do that for us)
+    import glob
+    import os
+
+    filenames = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                print('No files match ' + pattern)
+        else:
+            matches = [pattern]
+        for filename in matches:
+            filename = os.path.abspath(filename)
+            if filename not in filenames:
+                filenames.append(filename)
+    return filenames
+
+
+def parse_sccm_files(filenames, workers=1, use_mmap=False):
+    # [(list of ServerRecords, counters)] for each file, parsed at the same time in separate processes
+    # (a single file is split up by parse_sccm_file instead)
+    import os
+
+    if not filenames:
+        return []
+    if len(filenames) == 1:
+        return [parse_sccm_file(filenames[0], workers, use_mmap)]
+
+    if workers is None or workers < 1:
+        workers = os.cpu_count() or 1
+    if workers == 1:
+        return [parse_sccm_file(filename, 1, use_mmap) for filename in filenames]
+
+    # only imported here, it's slow to load and most runs don't need it
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(filenames))) as pool:
+        futures = [pool.submit(parse_sccm_file, filename, 1, use_mmap) for filename in filenames]
+        return [future.result() for future in futures]
+
+
+def merge_records(record_lists):
+    # (one list of ServerRecords, number of duplicates) from several files, with each server only once -
+    # if a server is in more than one file, the record where the query ran wins, then the one where it gave False,
+    # then the first one
+    def rank(record):
+        if record.query_ran:
+            return 2
+        if record.query_ran is None:
+            return 0
+        return 1
+
+    merged = {}
+    duplicates = 0
+    for records in record_lists:
+        for record in records:
+            if record.server in merged:
+                duplicates += 1
+                if rank(record) <= rank(merged[record.server]):
+                    continue
+            merged[record.server] = record
+    return list(merged.values()), duplicates
+
+
+def report_directory_name(filename, filenames):
+    # folder name for an input file's own report - its name without the extension, unless another input file
+    # has the same name, then the rest of the path that's different, with the separators replaced
+    import os
+    name = without_extension(os.path.basename(filename))
+    same_name = [other for other in filenames if without_extension(os.path.basename(other)) == name]
+    if len(same_name) > 1:
+        different = os.path.relpath(filename, os.path.commonpath(same_name))
+        name = without_extension(different).replace(os.sep, '_').replace('/', '_').replace(':', '')
+    return name
+
+
+def without_extension(filename):
+    # "export.txt" -> "export", and "export.txt.gz" -> "export" too
+    import os
+    name, extension = os.path.splitext(filename)
+    if extension.lower() in ('.gz', '.xz', '.bz2', '.zst'):
+        name = os.path.splitext(name)[0]
+    return name
+
+
+def merge_catalog_sets(first, second):
+    # one CatalogSet with the SQL versions of both (second wins if a version is in both)
+    merged = []
+    for first_part, second_part in zip(first[1:], second[1:]):
+        part = dict(first_part)
+        part.update(second_part)
+        merged.append(part)
+    release_types = list(first.release_types) + [release_type for release_type in second.release_types if release_type not in first.release_types]
+    return CatalogSet(release_types, *merged)
+
+
+def warm_catalog_set(warm, release_types, refresh_minutes, cache_dir, cache_ttl_hours=24, offline=False,
+                     catalog_url=None, timeout=30, retries=3, snapshot=None):
+    # CatalogSet for the SQL versions, kept in warm (a dict, empty the first time) between calls so the webpages
+    # are only loaded again every refresh_minutes, or when a SQL version shows up that hasn't been loaded yet
+    import time
+
+    if warm.get('catalog_set') is not None and time.time() - warm['loaded'] >= refresh_minutes * 60:
+        # load every version that's been seen so far again, so they all stay warm
+        release_types = list(warm['catalog_set'].release_types) + [release_type for release_type in release_types
+                                                                   if release_type not in warm['catalog_set'].release_types]
+        warm['catalog_set'] = None
+
+    if warm.get('catalog_set') is None:
+        warm['catalog_set'] = load_catalog_set(release_types, cache_dir, cache_ttl_hours=cache_ttl_hours, offline=offline,
+                                               catalog_url=catalog_url, timeout=timeout, retries=retries, snapshot=snapshot)
+        warm['loaded'] = time.time()
+        return warm['catalog_set']
+
+    missing = [release_type for release_type in release_types if release_type not in warm['catalog_set'].release_types]
+    if missing:
+        warm['catalog_set'] = merge_catalog_sets(warm['catalog_set'],
+                                                 load_catalog_set(missing, cache_dir, cache_ttl_hours=cache_ttl_hours, offline=offline,
+                                                                  catalog_url=catalog_url, timeout=timeout, retries=retries,
+                                                                  snapshot=snapshot))
+    return warm['catalog_set']
+
+
+def replace_directory(temp_directory, directory):
+    # moves a finished report folder into place, so nobody ever sees a half-written report
+    # (a folder can't be replaced in one step if it's already there, so the old one is moved out of the way first)
+    import os
+    import shutil
+
+    old_directory = None
+    if os.path.exists(directory):
+        old_directory = directory + '.old'
+        shutil.rmtree(old_directory, ignore_errors=True)
+        os.replace(directory, old_directory)
+    os.replace(temp_directory, directory)
+    if old_directory is not None:
+        shutil.rmtree(old_directory, ignore_errors=True)
+
+
+def watch(directory, output_directory, pattern='*.txt', poll_seconds=2, catalog_refresh_minutes=60, cache_dir=None,
+          cache_ttl_hours=24, offline=False, catalog_url=None, catalog_timeout=30, catalog_retries=3, current_within_months=2,
+          staleness_buckets=(6, 12, 24), use_mmap=False, history=False, history_db=None, max_polls=None, catalog_snapshot=None,
+          columnar=None):
+    # keeps checking directory for SCCM output files matching pattern and writes the reports for each new (or changed)
+    # one into its own folder in output_directory, named after the file
+    # the sqlserverbuilds catalogs stay loaded between files (see warm_catalog_set), so each file only costs
+    # parsing and writing - a file is only picked up once it has stopped changing for one poll
+    # files that already have a report folder when this starts are skipped
+    # stops after max_polls checks (None = forever, until ctrl-c)
+    import os
+    import glob
+    import time
+    import shutil
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    if history_db is None:
+        history_db = default_history_db()
+    os.makedirs(output_directory, exist_ok=True)
+
+    warm = {}
+    # file name -> (size, modified time) when it was last processed, or when it was last seen if it's still changing
+    # (or failed, so it's tried again)
+    processed = {}
+    changing = {}
+    # file name -> ((size, modified time), error) of its last failure
+    failed = {}
+    for filename in glob.glob(os.path.join(directory, pattern)):
+        if os.path.exists(os.path.join(output_directory, report_directory_name(filename, [filename]))):
+            status = os.stat(filename)
+            processed[filename] = (status.st_size, status.st_mtime_ns)
+
+    print('Watching ' + os.path.join(directory, pattern) + ' - reports go in ' + output_directory + ' (ctrl-c to stop)')
+    polls = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            polls += 1
+            for filename in sorted(glob.glob(os.path.join(directory, pattern))):
+                try:
+                    status = os.stat(filename)
+                except OSError: # deleted since glob found it
+                    continue
+                seen = (status.st_size, status.st_mtime_ns)
+                if processed.get(filename) == seen:
+                    continue
+                # still being copied in - wait until it's the same two polls in a row
+                if changing.get(filename) != seen:
+                    changing[filename] = seen
+                    continue
+                del changing[filename]
+
+                started = time.perf_counter()
+                name = report_directory_name(filename, [filename])
+                temp_directory = os.path.join(output_directory, '.' + name + '.tmp')
+                try:
+                    # never move files left over from an earlier attempt into place
+                    shutil.rmtree(temp_directory, ignore_errors=True)
+                    records, counts = parse_sccm_file(filename, workers=1, use_mmap=use_mmap)
+                    catalog_set = warm_catalog_set(warm, release_types_in(records), catalog_refresh_minutes, cache_dir,
+                                                   cache_ttl_hours=cache_ttl_hours, offline=offline, catalog_url=catalog_url,
+                                                   timeout=catalog_timeout, retries=catalog_retries, snapshot=catalog_snapshot)
+                    report = write_report(temp_directory, records, counts, catalog_set, current_within_months=current_within_months,
+                                          staleness_buckets=staleness_buckets, columnar=columnar)
+                    replace_directory(temp_directory, os.path.join(output_directory, name))
+                except Exception as error:
+                    # one bad file shouldn't stop the watching - it's tried again on the next polls (like after the
+                    # network is back), but the same error is only printed once
+                    shutil.rmtree(temp_directory, ignore_errors=True)
+                    changing[filename] = seen
+                    if failed.get(filename) != (seen, str(error)):
+                        failed[filename] = (seen, str(error))
+                        print('Could not process ' + filename + ' (trying again on the next polls): ' + str(error))
+                    continue
+                processed[filename] = seen
+                failed.pop(filename, None)
+                if history:
+                    try:
+                        record_history(history_db, time.strftime("%Y-%m-%d %H:%M:%S"), report['stats'], report['sql_rows'],
+                                       report['release_types'], report['months_behind'], report['known'])
+                    except Exception as error:
+                        print('Could not add ' + filename + ' to the history database: ' + str(error))
+                print(filename + ': ' + str(counts['servers']) + ' servers, ' + str(report['stats']['not_current']) + 
+                      ' out of date (' + format(time.perf_counter() - started, '.2f') + ' seconds)')
+
+            if max_polls is None or polls < max_polls:
+                time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        print('Stopped watching ' + directory)
+
+
+def load_available_catalog_set(release_types, cache_dir, cache_ttl_hours=24, offline=False, refresh=False,
+                               catalog_url=None, timeout=30, retries=3, snapshot=None):
+    # like load_catalog_set, but a SQL version whose webpage can't be loaded is left out (with a message)
+    # instead of stopping everything
+    try:
+        return load_catalog_set(release_types, cache_dir, cache_ttl_hours=cache_ttl_hours, offline=offline, refresh=refresh,
+                                catalog_url=catalog_url, timeout=timeout, retries=retries, snapshot=snapshot)
+    except Exception:
+        pass
+
+    catalog_set = None
+    for release_type in release_types:
+        try:
+            loaded = load_catalog_set([release_type], cache_dir, cache_ttl_hours=cache_ttl_hours, offline=offline, refresh=refresh,
+                                      catalog_url=catalog_url, timeout=timeout, retries=retries, snapshot=snapshot)
+        except Exception as error:
+            print('Could not load the SQL Server ' + release_type + ' builds page, leaving it out: ' + str(error))
+            continue
+        catalog_set = loaded if catalog_set is None else merge_catalog_sets(catalog_set, loaded)
+    if catalog_set is None:
+        catalog_set = CatalogSet([], {}, {}, {}, {}, {})
+    return catalog_set
+
+
+def lookup_build(catalog_set, product_version, product_level='', current_within_months=2):
+    # dict about one SQL Server build, with the same answers as the columns of serversWithMSSQL.csv -
+    # for the lookup service, so it can be turned into JSON as is
+    product_version = str(product_version).strip()
+    product_level = str(product_level or '').strip()
+    result = {'build': product_version, 'product_level': product_level}
+
+    release_type = sql_release_type(product_version) if parse_build(product_version) is not None else None
+    if release_type is None:
+        result['error'] = 'not a SQL Server build number'
+        return result
+    if release_type not in catalog_set.indexes:
+        result['error'] = 'the SQL Server ' + release_type + ' builds page is not loaded'
+        return result
+
+    index = catalog_set.indexes[release_type]
+    record = ServerRecord('', True, '', product_version, product_level, '')
+    row, curr_version_date, sp_outofdate = enrich_record(record, release_type, index, catalog_set.last_release_dates[release_type],
+                                                         catalog_set.highest_sps.get(release_type, ""))
+    months_behind, is_current, known, bucket_counts = compute_staleness([curr_version_date], [row[8]], current_within_months, ())
+    branch = branch_status(index, parse_build(product_version))[0]
+
+    result.update({'sql_version': release_type,
+                   'known_build': product_version in index.builds,
+                   'release_date': curr_version_date,
+                   'current': bool(is_current[0]) if known[0] else None,
+                   'months_behind': int(months_behind[0]) if known[0] else None,
+                   'update_available': row[7] == 'True',
+                   'newest_build': '.'.join(str(part) for part in index.sorted_builds[-1]),
+                   'newest_update_date': row[8],
+                   'newest_cumulative_update': '.'.join(str(part) for part in index.cumulative_updates[-1]) if index.cumulative_updates else None,
+                   'cumulative_updates_behind': int(row[11]),
+                   'security_update_needed': None if row[9] == '' else (False if row[9] == 'False' else row[9]),
+                   'service_pack': branch,
+                   'newest_cumulative_update_for_service_pack': row[12] or None,
+                   'new_service_pack': row[10] or None})
+    return result
+
+
+def serve(host, port, cache_dir=None, cache_ttl_hours=24, offline=False, catalog_url=None, catalog_timeout=30, catalog_retries=3,
+          current_within_months=2, catalog_refresh_minutes=60, cache_size=65536, release_types=None, catalog_snapshot=None):
+    # small web service for looking up builds without running the whole SCCM parse:
+    #   GET /lookup?build=14.0.3294.2&level=RTM - one build
+    #   POST /lookup with {"builds": ["14.0.3294.2", ...]} or
+    #                     {"servers": [{"server": "SERVER4", "product_version": "14.0.3294.2", "product_level": "RTM"}, ...]}
+    #                     - a lot of them at once, answered as {"results": [...]}
+    #   GET /stats - how many lookups were answered from the cache, and when the webpages were loaded
+    # the webpages of every SQL version (or release_types) are loaded when it starts and again every catalog_refresh_minutes,
+    # and the last cache_size different answers are kept
+    import json
+    import time
+    import threading
+    import functools
+    import urllib.parse
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    if release_types is None:
+        release_types = [release_type for release_type, family, webpage in sql_versions]
+
+    state = {'catalog_set': load_available_catalog_set(release_types, cache_dir, cache_ttl_hours=cache_ttl_hours, offline=offline,
+                                                       catalog_url=catalog_url, timeout=catalog_timeout,
+                                                       retries=catalog_retries, snapshot=catalog_snapshot),
+             'loaded': time.time()}
+    reload_lock = threading.Lock()
+
+    @functools.lru_cache(maxsize=cache_size)
+    def cached_lookup(product_version, product_level):
+        return json.dumps(lookup_build(state['catalog_set'], product_version, product_level, current_within_months))
+
+    def catalog_set_age_check():
+        # load the webpages again when they're too old - the cached answers go with them
+        if time.time() - state['loaded'] < catalog_refresh_minutes * 60:
+            return
+        with reload_lock:
+            if time.time() - state['loaded'] < catalog_refresh_minutes * 60:
+                return
+            state['catalog_set'] = load_available_catalog_set(release_types, cache_dir, cache_ttl_hours=cache_ttl_hours,
+                                                              offline=offline, catalog_url=catalog_url, timeout=catalog_timeout,
+                                                              retries=catalog_retries, snapshot=catalog_snapshot)
+            state['loaded'] = time.time()
+            cached_lookup.cache_clear()
+
+    def lookup(product_version, product_level=''):
+        # the answers are cached as JSON text, so they are only turned into JSON once
+        return cached_lookup(str(product_version or ''), str(product_level or ''))
+
+    class LookupHandler(BaseHTTPRequestHandler):
+        # keep connections open between requests, every answer has a Content-Length - and send the headers and
+        # the answer straight away instead of waiting for the client to acknowledge the headers
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def send_json(self, status, body):
+            body = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_error_json(self, status, message):
+            self.send_json(status, json.dumps({'error': message}))
+
+        def do_GET(self):
+            catalog_set_age_check()
+            url = urllib.parse.urlsplit(self.path)
+            query = urllib.parse.parse_qs(url.query)
+            if url.path == '/lookup':
+                if 'build' not in query:
+                    self.send_error_json(400, 'give a build, like /lookup?build=14.0.3294.2')
+                    return
+                self.send_json(200, lookup(query['build'][0], query.get('level', [''])[0]))
+            elif url.path == '/stats':
+                cache_info = cached_lookup.cache_info()
+                self.send_json(200, json.dumps({'cache_hits': cache_info.hits, 'cache_misses': cache_info.misses,
+                                                'cached_answers': cache_info.currsize, 'cache_size': cache_info.maxsize,
+                                                'sql_versions': state['catalog_set'].release_types,
+                                                'catalogs_loaded': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(state['loaded']))}))
+            else:
+                self.send_error_json(404, 'use /lookup or /stats')
+
+        def do_POST(self):
+            catalog_set_age_check()
+            if urllib.parse.urlsplit(self.path).path != '/lookup':
+                self.send_error_json(404, 'use /lookup')
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+            except ValueError:
+                self.send_error_json(400, 'the request has to be JSON')
+                return
+            if not isinstance(request, dict):
+                self.send_error_json(400, 'send {"builds": [...]} or {"servers": [...]}')
+                return
+
+            for key in ['builds', 'servers']:
+                if request.get(key) is not None and not isinstance(request[key], list):
+                    self.send_error_json(400, '"' + key + '" has to be a list')
+                    return
+
+            results = []
+            for build in request.get('builds') or []:
+                # anything that isn't a build number as text is skipped, like servers that aren't objects
+                if not isinstance(build, str):
+                    continue
+                results.append(lookup(build))
+            for server in request.get('servers') or []:
+                if not isinstance(server, dict):
+                    continue
+                # the cached answer is JSON text, so the server name is spliced onto the front of it
+                results.append('{"server": ' + json.dumps(str(server.get('server', ''))) + ', ' +
+                               lookup(server.get('product_version'), server.get('product_level'))[1:])
+            self.send_json(200, '{"results": [' + ', '.join(results) + ']}')
+
+        def log_message(self, format, *args):
+            # thousands of requests a second would drown the console
+            pass
+
+    server = ThreadingHTTPServer((host, port), LookupHandler)
+    print('Answering build lookups on http://' + host + ':' + str(server.server_port) + '/lookup for SQL Server ' + 
+          ', '.join(state['catalog_set'].release_types) + ' (ctrl-c to stop)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('Stopped the lookup service')
+    finally:
+        server.server_close()
+
+
+def enrich_record(record, release_type, curr_index, last_release_date, biggest_sp):
+    # (row of serversWithMSSQL.csv, current version's release date, whether the service pack is out of date)
+    # for a server with SQL - column (7) is left empty, it is filled in for all servers at once by compute_staleness
+    product_version = record.product_version
+
+    # (1) - (5) same as the first csv file
+    row = all_servers_row(record)
+
+    # (6) current version's date
+    curr_build = parse_build(product_version)
+
+    # make sure the version is present in the webpage
+    if product_version in curr_index.builds:
+        curr_version_date = curr_index.builds[product_version].release_date
+    else: # version was not found in webpage for some reason - use the closest build that is on it
+        nearest_build, nearest_info = nearest_known_build(curr_index, curr_build)
+        curr_version_date = nearest_info.release_date
+        print('There was a problem - the version ' + product_version + ' was not found on the webpage, ', end='')
+        print('using the release date of the nearest build ' + '.'.join(str(part) for part in nearest_build))
+    row.append(curr_version_date)
+
+    # (7) updates current within two months?
+    row.append('')
+
+    # (8) update available - is there any build for this SQL version newer than the one installed
+    if curr_build < curr_index.sorted_builds[-1]:
+        row.append('True')
     else:
-        pluralornot = " servers"
-        
-    
+        row.append('False')
 
-#     import smtplib
-#     from email.message import EmailMessage
+    # (9) newest update release date   
+    row.append(last_release_date)
 
+    # (10) security update needed - the KB of the newest security update, if there's one newer than the installed build
+    row.append(security_update_needed(curr_index, curr_build))
 
-#     message = """
-# Hello, this is the automated bi-weekly SQL Server update. (alright, it's not exactly automated yet, but we're getting there!)
-# There are """ + str(twomonthsout) + pluralornot + """ with updates pending that are two months or older.
+    # service pack (or RTM) the build is on and the newest cumulative update for it, from the service pack ladder
+    branch, branch_latest_cu = branch_status(curr_index, curr_build)[:2]
 
-# The first CSV file attached contains information about the SQL Version on specific servers, and the second includes all servers
-# scanned but with little information about SQL Version.
-# The text file attached has some simple statistics about the number of servers with SQL, and the SQL Versions present on servers.
+    # (11) new service pack available
+    # SQL Server 2017 and greater does not have service packs
+    sp_outofdate = False
+    if not biggest_sp: 
+        row.append('')
+    # compare highest service pack for the year's version to service pack installed on server (as numbers, so SP10 > SP2) -
+    # if the server didn't say which service pack it's on, the build number tells
+    else:
+        installed_sp = service_pack_number(record.product_level)
+        if installed_sp is None:
+            installed_sp = service_pack_number(branch)
+        if installed_sp < service_pack_number(biggest_sp):
+            sp_outofdate = True
+            row.append(biggest_sp)
+        else:
+            row.append('')
 
-# """
-    
+    # (12) cumulative updates behind
+    row.append(str(cumulative_updates_behind(curr_index, curr_build)))
 
-#     email = EmailMessage()
-#     email["From"] = ''
-#     email["Subject"] = "SQL Server Version Updatesssss"
-#     email["To"] = [''] 
-#     email.set_content(message)
-#     with open('serversWithMSSQL.csv','rb') as content_file:
-#         content = content_file.read()
-#         email.add_attachment(content,maintype='csv',subtype='csv',filename='serversWithMSSQL.csv')
-#     with open('MSSQLoutputStats','rb') as text_file:
-#         content2 = text_file.read()
-#         email.add_attachment(content2,maintype='txt',subtype='txt',filename='SQLstats.txt')
-#     with open(csvname,'rb') as csv_file:
-#         content3 = csv_file.read()
-#         email.add_attachment(content3,maintype='csv',subtype='csv',filename='allScannedServers.csv')
+    # (13) latest cumulative update within the installed service pack
+    row.append(build_string(branch_latest_cu) if branch_latest_cu else '')
 
-#     smtpObj = smtplib.SMTP('insert mail server here')
-#     smtpObj.send_message(email)         
-#     print("Successfully sent email with SQL Server information")
-         
-        
-       
-        
-def recent_release(app_dataframe):
-    # get most recent version update date - will be printed to csv file later
+    return row, curr_version_date, sp_outofdate
+
+
+def record_fingerprint(record):
+    # short hash of everything the SCCM output said about a server
+    import hashlib
+    return hashlib.sha1('\t'.join(map(str, record)).encode('utf-8')).hexdigest()
+
+
+def catalog_signature(index, last_release_date, biggest_sp):
+    # changes whenever a SQL version's webpage gets a new build, so results from an older webpage aren't reused
+    # (results worked out differently by another version of the program are taken care of by state_format)
+    newest_build = build_string(index.sorted_builds[-1]) if index.sorted_builds else ''
+    return newest_build + '|' + str(len(index.sorted_builds)) + '|' + \
+           str(last_release_date) + '|' + str(biggest_sp) + '|' + str(len(index.security_updates))
+
+
+# version of the state file - change it whenever the results for a server are worked out differently (or the
+# state file looks different), so the next incremental run starts over instead of reusing old results
+#   2 - security updates are matched to the servicing track of the build
+#   3 - rows have the latest cumulative update for the installed service pack
+state_format = 3
+
+
+def load_state(state_file):
+    # server -> what it looked like last run (and its results), or nothing if there was no last run
+    # (or the last run was made by a version of the program with another state_format)
+    import json
+    try:
+        with open(state_file, 'r') as state:
+            saved = json.load(state)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(saved, dict) or saved.get('format') != state_format:
+        return {}
+    return saved.get('servers', {})
+
+
+def save_state(state_file, servers):
+    import json
+    import time
+
+    # write to a temporary file first so a run that gets interrupted never leaves half a state file behind
+    with replacing_file(state_file) as state:
+        json.dump({'format': state_format, 'saved': time.time(), 'servers': servers}, state)
+
+
+def write_changes_csv(csvname, previous_state, new_state):
+    # servers that are new, changed or gone since the last run, with what they looked like before and now
+    import csv
+
+    def described(state):
+        if state is None:
+            return ['', '', '', '']
+        record = ServerRecord(*state['record'])
+        query_ran = 'Blank output' if record.query_ran is None else str(record.query_ran)
+        return [query_ran, record.edition, record.product_version, record.product_level]
+
+    with open(csvname, 'w', newline='', buffering=1024 * 1024) as file:
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(['Server', 'Change',
+                         'Previous Did SQL Query Run?', 'Previous Edition', 'Previous Product Version', 'Previous Product Level',
+                         'Did SQL Query Run?', 'Edition', 'Product Version', 'Product Level'])
+        for server, state in new_state.items():
+            previous = previous_state.get(server)
+            if previous is None:
+                writer.writerow([server, 'New'] + described(None) + described(state))
+            elif previous.get('fingerprint') != state['fingerprint']:
+                writer.writerow([server, 'Changed'] + described(previous) + described(state))
+        for server, previous in previous_state.items():
+            if server not in new_state:
+                writer.writerow([server, 'Removed'] + described(previous) + described(None))
+
+
+def default_history_db():
+    import os
+    return os.path.join(os.path.expanduser("~"), '.mssql-version-sccm', 'history.sqlite')
+
+
+def open_history(history_db):
+    # sqlite connection to the history database, making the tables the first time
+    # runs - one row per execution with the MSSQLoutputStats counters
+    # results - one row per server with SQL per execution, indexed by server, run and SQL version
+    # databases from before a column was added get it added (empty for the old runs)
+    import os
+    import sqlite3
+
+    os.makedirs(os.path.dirname(os.path.abspath(history_db)), exist_ok=True)
+    connection = sqlite3.connect(history_db)
+    connection.executescript('''
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY,
+            run_time TEXT NOT NULL,
+            servers INTEGER, has_sql INTEGER, not_with_sql INTEGER, didnot_run INTEGER, gave_warning INTEGER,
+            not_current INTEGER, outofdate_sp INTEGER, staleness_buckets TEXT, bucket_counts TEXT,
+            security_needed INTEGER, sql_instances INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS runs_by_time ON runs (run_time);
+        CREATE TABLE IF NOT EXISTS results (
+            run_id INTEGER NOT NULL REFERENCES runs (run_id),
+            server TEXT NOT NULL,
+            release_type TEXT NOT NULL,
+            edition TEXT, product_version TEXT, product_level TEXT,
+            curr_version_date TEXT, last_update_date TEXT,
+            months_behind INTEGER, current INTEGER, update_available INTEGER,
+            cumulative_updates_behind INTEGER, new_service_pack TEXT,
+            security_update_needed INTEGER, security_update TEXT, latest_cu_for_service_pack TEXT
+        );
+        CREATE INDEX IF NOT EXISTS results_by_server ON results (server, run_id);
+        CREATE INDEX IF NOT EXISTS results_by_run ON results (run_id, release_type, months_behind);
+        CREATE INDEX IF NOT EXISTS results_by_release_type ON results (release_type, run_id);
+    ''')
+    for table, column, column_type in history_added_columns:
+        columns = [info[1] for info in connection.execute('PRAGMA table_info(' + table + ')')]
+        if column not in columns:
+            with connection:
+                connection.execute('ALTER TABLE ' + table + ' ADD COLUMN ' + column + ' ' + column_type)
+    return connection
+
+
+# columns added to the history database after it was first made: (table, column, type)
+history_added_columns = [('runs', 'security_needed', 'INTEGER'), ('runs', 'sql_instances', 'INTEGER'),
+                         ('results', 'security_update_needed', 'INTEGER'), ('results', 'security_update', 'TEXT'),
+                         ('results', 'latest_cu_for_service_pack', 'TEXT')]
+
+
+def record_history(history_db, run_time, run_stats, sql_rows, release_types, months_behind, known):
+    # adds one run to the history database - sql_rows are the rows of serversWithMSSQL.csv
+    import json
+
+    connection = open_history(history_db)
+    with connection:
+        cursor = connection.execute(
+            'INSERT INTO runs (run_time, servers, has_sql, not_with_sql, didnot_run, gave_warning, not_current, outofdate_sp, '
+            'staleness_buckets, bucket_counts, security_needed, sql_instances) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (run_time, run_stats['servers'], run_stats['has_sql'], run_stats['not_with_sql'], run_stats['didnot_run'],
+             run_stats['gave_warning'], run_stats['not_current'], run_stats['outofdate_sp'],
+             json.dumps(run_stats['staleness_buckets']), json.dumps(run_stats['bucket_counts']), run_stats['security_needed'],
+             run_stats['sql_instances']))
+        run_id = cursor.lastrowid
+
+        def result_rows():
+            for row, release_type, months, date_known in zip(sql_rows, release_types, months_behind, known):
+                # column (10) is the KB of the security update that's needed, 'False', or '' if the webpage has none
+                yield (run_id, row[0], release_type, row[2], row[3], row[4], row[5], row[8],
+                       int(months) if date_known else None, (row[6] == 'True') if date_known else None,
+                       row[7] == 'True', int(row[11]), row[10],
+                       None if row[9] == '' else row[9] != 'False', None if row[9] in ('', 'False') else row[9],
+                       row[12] or None)
+
+        connection.executemany(
+            'INSERT INTO results (run_id, server, release_type, edition, product_version, product_level, curr_version_date, '
+            'last_update_date, months_behind, current, update_available, cumulative_updates_behind, new_service_pack, '
+            'security_update_needed, security_update, latest_cu_for_service_pack) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', result_rows())
+    connection.close()
+    return run_id
+
+
+def server_trend(history_db, server):
+    # (run time, product version, product level, months behind, cumulative updates behind, security update needed)
+    # for every run a server was in - the security update is its KB, or None if it wasn't needed (or isn't known)
+    connection = open_history(history_db)
+    rows = connection.execute(
+        'SELECT runs.run_time, results.product_version, results.product_level, results.months_behind, '
+        'results.cumulative_updates_behind, results.security_update FROM results JOIN runs ON runs.run_id = results.run_id '
+        'WHERE results.server = ? ORDER BY results.run_id', (server,)).fetchall()
+    connection.close()
+    return rows
+
+
+def lag_histogram(history_db, boundaries=(2, 6, 12, 24), release_type=None, run_id=None):
+    # (run time, [(label, number of servers)]) for how many months behind the servers were in a run
+    # (the latest run unless run_id is given), optionally for just one SQL version like '2017'
+    connection = open_history(history_db)
+    if run_id is None:
+        run_id = connection.execute('SELECT MAX(run_id) FROM runs').fetchone()[0]
+    if run_id is None:
+        connection.close()
+        return None, []
+    run_time = connection.execute('SELECT run_time FROM runs WHERE run_id = ?', (run_id,)).fetchone()[0]
+
+    # one CASE branch per bucket, so sqlite counts everything in a single pass over the run's index entries
+    labels = ['less than ' + months_label(boundaries[0])]
+    case = 'CASE WHEN months_behind < ' + str(int(boundaries[0])) + ' THEN 0'
+    for bucket, low in enumerate(boundaries):
+        if bucket + 1 < len(boundaries):
+            labels.append(months_label(low) + ' - ' + months_label(boundaries[bucket + 1]))
+            case += ' WHEN months_behind < ' + str(int(boundaries[bucket + 1])) + ' THEN ' + str(bucket + 1)
+        else:
+            labels.append(months_label(low) + ' or more')
+    case += ' ELSE ' + str(len(boundaries)) + ' END'
+
+    query = 'SELECT ' + case + ' AS bucket, COUNT(*) FROM results WHERE run_id = ? AND months_behind IS NOT NULL'
+    parameters = [run_id]
+    if release_type is not None:
+        query += ' AND release_type = ?'
+        parameters.append(release_type)
+    counts = dict(connection.execute(query + ' GROUP BY bucket', parameters).fetchall())
+    connection.close()
+    return run_time, [(label, counts.get(bucket, 0)) for bucket, label in enumerate(labels)]
+
+
+# header of both CSV files
+csv_header = ['Server', 'Did SQL Query Run?', 'Edition', 'Product Version', 'Product Level', 'Curr_Version Release Date',
+              'Updates Current Within Two Months', 'Update Available', 'Last Update Release Date',
+              'Security Update Needed', 'New Service Pack Available', 'Cumulative Updates Behind', 'Latest CU For Service Pack',
+              'Other']
+
+
+@contextlib.contextmanager
+def profile_phase(run_profile, name):
+    # times the with block as one phase of the run in run_profile (nothing happens if it's None) -
+    # wall and CPU seconds are added up if a phase runs more than once, like 'report' with --per-input-reports,
+    # and the memory peak is kept while tracemalloc is on
+    # CPU seconds are only this process, not the --workers processes
+    # gives the phase's dict so counters like 'records' can be added to it
+    if run_profile is None:
+        yield {}
+        return
+
+    import time
+    import tracemalloc
+
+    phase = run_profile['phases'].setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield phase
+    finally:
+        phase['wall_seconds'] += time.perf_counter() - wall_start
+        phase['cpu_seconds'] += time.process_time() - cpu_start
+        if tracing:
+            phase['peak_memory_bytes'] = max(phase.get('peak_memory_bytes', 0), tracemalloc.get_traced_memory()[1])
+
+
+def start_profile(profile_with=None):
+    # an empty run profile for profile_phase, with cProfile or tracemalloc running if profile_with says so
+    import time
+    import tracemalloc
+
+    run_profile = {'phases': {}, 'counters': {}, 'profile_with': profile_with,
+                   'started': time.time(), 'wall_start': time.perf_counter(), 'cpu_start': time.process_time()}
+    if profile_with == 'cprofile':
+        import cProfile
+        run_profile['profiler'] = cProfile.Profile()
+        run_profile['profiler'].enable()
+    elif profile_with == 'tracemalloc':
+        tracemalloc.start()
+    return run_profile
+
+
+def finish_profile(run_profile, profile_file, top_functions=25):
+    # stops cProfile or tracemalloc and writes the run profile to profile_file as JSON - with cProfile, the
+    # full stats also go into profile_file + '.pstats' (open them with python -m pstats) and the slowest
+    # top_functions (by cumulative time) into the JSON
+    import os
+    import json
+    import time
+    import tracemalloc
+
+    metrics = {'run_time': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run_profile['started'])),
+               'wall_seconds': time.perf_counter() - run_profile['wall_start'],
+               'cpu_seconds': time.process_time() - run_profile['cpu_start'],
+               'profile_with': run_profile['profile_with'],
+               'phases': run_profile['phases'], 'counters': run_profile['counters']}
+    os.makedirs(os.path.dirname(os.path.abspath(profile_file)), exist_ok=True)
+
+    if 'profiler' in run_profile:
+        import pstats
+        profiler = run_profile['profiler']
+        profiler.disable()
+        profiler.dump_stats(profile_file + '.pstats')
+        functions = []
+        for (filename, line, function), (primitive_calls, calls, total, cumulative, callers) in pstats.Stats(profiler).stats.items():
+            functions.append({'function': function, 'file': filename, 'line': line, 'calls': calls,
+                              'total_seconds': total, 'cumulative_seconds': cumulative})
+        functions.sort(key=lambda function: function['cumulative_seconds'], reverse=True)
+        metrics['cprofile_top'] = functions[:top_functions]
+
+    if tracemalloc.is_tracing() and run_profile['profile_with'] == 'tracemalloc':
+        peaks = [phase['peak_memory_bytes'] for phase in run_profile['phases'].values() if 'peak_memory_bytes' in phase]
+        metrics['peak_memory_bytes'] = max(peaks + [tracemalloc.get_traced_memory()[1]])
+        tracemalloc.stop()
+
+    with replacing_file(profile_file) as output:
+        json.dump(metrics, output, indent=2)
+
+
+def all_servers_row(record):
+    # row of allScannedServers.csv for a ServerRecord
+    # sometimes PowerShell script will fail entirely, and 
+    # there will not even be "Did SQL Query Run?" output
+    if record.query_ran is None:
+        return [record.server, 'Blank output - issue running query']
+    # SQL is installed on server - Edition, Product Version and Product Level
+    if record.query_ran:
+        return [record.server, 'True', record.edition, record.product_version, record.product_level]
+    # if false, might not have SQL, OR there could have been an error when querying
+    if record.warning:
+        # print the WARNING in the "other" column of csv file
+        return [record.server, 'False'] + [''] * (len(csv_header) - 3) + [record.warning]
+    return [record.server, 'False']
+
+
+def write_csv(csvname, rows):
+    # writes the header and all of the rows in one go through a large buffer
+    # (fields with commas or quotes in them, like some editions and warnings, get quoted)
+    import csv
+    with open(csvname, 'w', newline='', buffering=1024 * 1024) as file:
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(csv_header)
+        writer.writerows(rows)
+
+
+def import_pyarrow():
+    # pyarrow is only needed for --columnar, so it's not required for anything else
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('--columnar needs the pyarrow package (pip install pyarrow)')
+    return pyarrow
+
+
+def write_columnar(output_directory, records, enriched=None, run_stats=None, formats=('arrow',),
+                   current_within_months=2, staleness_buckets=(6, 12, 24)):
+    # the same results as the CSV files and the stats file, but with typed columns - dates are dates, True/False are
+    # booleans (null when it isn't known), numbers are numbers, and SQL versions, editions and product levels are
+    # dictionary encoded - in each of formats:
+    #   'arrow' - allScannedServers.arrow, serversWithMSSQL.arrow and MSSQLoutputStats.arrow, uncompressed Arrow IPC
+    #             files that can be memory-mapped (pyarrow.memory_map + pyarrow.ipc.open_file) without copying
+    #   'parquet' - the same three as .parquet files
+    # without enriched and run_stats (like with parse_only) only allScannedServers is written
+    # returns the names of the files it wrote
+    import os
+    pa = import_pyarrow()
+
+    def dictionary(values):
+        return pa.array(values, type=pa.string()).dictionary_encode()
+
+    def booleans(values):
+        return pa.array([True if value == 'True' else False if value == 'False' else None for value in values], type=pa.bool_())
+
+    def dates(values):
+        return pa.array(dates_array(values), type=pa.date32(), from_pandas=True)
+
+    tables = {}
+    tables['allScannedServers'] = pa.table({
+        'server': pa.array([record.server for record in records], type=pa.string()),
+        'query_ran': pa.array([record.query_ran for record in records], type=pa.bool_()),
+        'edition': dictionary([record.edition or None for record in records]),
+        'product_version': pa.array([record.product_version or None for record in records], type=pa.string()),
+        'product_level': dictionary([record.product_level or None for record in records]),
+        'other': pa.array([record.warning or None for record in records], type=pa.string()),
+    })
+
+    if enriched is not None:
+        import numpy as np
+        columns = list(zip(*enriched['sql_rows'])) or [()] * len(csv_header)
+        known = np.asarray(enriched['known'], dtype=bool)
+        months_behind = np.asarray(enriched['months_behind'], dtype=np.int64)
+        tables['serversWithMSSQL'] = pa.table({
+            'server': pa.array(columns[0], type=pa.string()),
+            'sql_version': dictionary(enriched['release_types']),
+            'edition': dictionary([value or None for value in columns[2]]),
+            'product_version': pa.array(columns[3], type=pa.string()),
+            'product_level': dictionary([value or None for value in columns[4]]),
+            'curr_version_release_date': dates(columns[5]),
+            'updates_current': booleans(columns[6]),
+            'months_behind': pa.array(months_behind, type=pa.int32(), mask=~known),
+            'update_available': booleans(columns[7]),
+            'last_update_release_date': dates(columns[8]),
+            # empty when the webpage doesn't list security updates, so it isn't known
+            'security_update_needed': pa.array([None if value == '' else value != 'False' for value in columns[9]],
+                                               type=pa.bool_()),
+            'security_update': pa.array([None if value in ('', 'False') else value for value in columns[9]], type=pa.string()),
+            'new_service_pack': dictionary([value or None for value in columns[10]]),
+            'cumulative_updates_behind': pa.array([int(value) for value in columns[11]], type=pa.int32()),
+            'latest_cu_for_service_pack': pa.array([value or None for value in columns[12]], type=pa.string()),
+        })
+
+    if run_stats is not None:
+        stats = {name: pa.array([run_stats[name]], type=pa.int64())
+                 for name in ['servers', 'has_sql', 'sql_instances', 'not_with_sql', 'didnot_run', 'gave_warning', 'not_current',
+                              'outofdate_sp', 'security_needed']}
+        stats['current_within_months'] = pa.array([current_within_months], type=pa.int32())
+        # one column for each staleness bucket, like behind_6_to_12_months and behind_24_months_or_more
+        for bucket, count in enumerate(run_stats['bucket_counts']):
+            if bucket + 1 < len(staleness_buckets):
+                name = 'behind_' + str(staleness_buckets[bucket]) + '_to_' + str(staleness_buckets[bucket + 1]) + '_months'
+            else:
+                name = 'behind_' + str(staleness_buckets[bucket]) + '_months_or_more'
+            stats[name] = pa.array([count], type=pa.int64())
+        stats['sql_versions'] = pa.array([sorted(enriched['versions_list'])], type=pa.list_(pa.string()))
+        tables['MSSQLoutputStats'] = pa.table(stats)
+
+    written = []
+    for name, table in tables.items():
+        if 'arrow' in formats:
+            written.append(os.path.join(output_directory, name + '.arrow'))
+            with pa.OSFile(written[-1], 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        if 'parquet' in formats:
+            import pyarrow.parquet
+            written.append(os.path.join(output_directory, name + '.parquet'))
+            pyarrow.parquet.write_table(table, written[-1])
+    return written
+
+
+def compute_staleness(curr_dates, last_dates, current_within_months=2, bucket_months=(6, 12, 24)):
+    # works out how far behind every server is in one go, from two lists of "2020-04-07" style dates
+    # (the installed build's release date and the newest update's release date for each server)
+    # returns:
+    #   months_behind - whole months between the two dates (counted like dateutil's relativedelta)
+    #   is_current - True where months_behind is less than current_within_months
+    #   known - False where either date was missing or not a date, those servers are left out of everything else
+    #   bucket_counts - number of servers at least bucket_months[i] (and less than bucket_months[i + 1]) months behind
+    import numpy as np
+
+    curr = dates_array(curr_dates)
+    last = dates_array(last_dates)
+    known = ~(np.isnat(curr) | np.isnat(last))
+
+    # whole months from the installed build's date to the newest update's date, counted like relativedelta:
+    # the installed build's day of the month is moved back to the end of the newest update's month if that is shorter (Jan 31 -> Feb 29),
+    # and a month isn't full yet if the day of the month hasn't been reached
+    # a newer build than the newest update (shouldn't happen, but the webpage can be out of date) gives negative months,
+    # and counts as current
+    curr = np.where(known, curr, np.datetime64('1970-01-01'))
+    last = np.where(known, last, np.datetime64('1970-01-01'))
+    curr_month = curr.astype('datetime64[M]')
+    last_month = last.astype('datetime64[M]')
+    months_behind = (last_month - curr_month).astype(np.int64)
+    curr_day = (curr - curr_month).astype(np.int64)
+    last_day = (last - last_month).astype(np.int64)
+    last_month_length = ((last_month + 1).astype('datetime64[D]') - last_month.astype('datetime64[D]')).astype(np.int64)
+    curr_day = np.minimum(curr_day, last_month_length - 1)
+    months_behind = np.where(last >= curr, months_behind - (last_day < curr_day), months_behind + (last_day > curr_day))
+
+    is_current = known & (months_behind < current_within_months)
+
+    bucket_counts = []
+    for bucket, low in enumerate(bucket_months):
+        in_bucket = known & (months_behind >= low)
+        if bucket + 1 < len(bucket_months):
+            in_bucket &= months_behind < bucket_months[bucket + 1]
+        bucket_counts.append(int(np.count_nonzero(in_bucket)))
+
+    return months_behind, is_current, known, bucket_counts
+
+
+def dates_array(dates):
+    # numpy datetime64 array from "2020-04-07" style strings, with NaT for anything that isn't a date
+    # (numpy only - runs with --catalog-snapshot never load pandas)
+    import numpy as np
+
+    # numpy would also take "2020" or "2020-04", only whole dates count
+    dates = [date if isinstance(date, str) and len(date) == 10 and date[4] == '-' and date[7] == '-' else 'NaT' for date in dates]
+    try:
+        return np.array(dates, dtype='datetime64[D]')
+    except ValueError:
+        # something like "2020-02-30" - one at a time, so only the bad ones become NaT
+        parsed = []
+        for date in dates:
+            try:
+                parsed.append(np.datetime64(date, 'D'))
+            except ValueError:
+                parsed.append(np.datetime64('NaT', 'D'))
+        return np.array(parsed, dtype='datetime64[D]')
+
+
+def months_label(months):
+    # 6 -> "6 months", 12 -> "1 year", 24 -> "2 years"
+    if months % 12 == 0:
+        years = months // 12
+        return str(years) + (" year" if years == 1 else " years")
+    return str(months) + (" month" if months == 1 else " months")
+
+
+# one row of a sqlserverbuilds page, as stored in a build index
+BuildInfo = collections.namedtuple('BuildInfo', ['release_date', 'description'])
+
+# everything known about the builds of one SQL version:
+#   builds - build string (like "14.0.3294.2") -> BuildInfo
+#   sorted_builds - every build as a tuple of ints (like (14, 0, 3294, 2)), smallest first
+#   sorted_info - the BuildInfo for each entry of sorted_builds
+#   cumulative_updates - the builds that are cumulative updates, as sorted tuples of ints
+#   security_updates - the builds that are security updates (or GDRs), as sorted tuples of ints
+#   security_kbs - the KB number of each entry of security_updates (like "KB4535288"), or its build if there isn't one
+#   branches - the service pack ladder: the first build of RTM and of every service pack, as sorted tuples of ints
+#   branch_levels - the product level of each entry of branches ("RTM", "SP1", "SP2"...)
+#   branch_latest_cus - the newest cumulative update of each entry of branches (None if it has none)
+CatalogIndex = collections.namedtuple('CatalogIndex', ['builds', 'sorted_builds', 'sorted_info', 'cumulative_updates',
+                                                       'security_updates', 'security_kbs',
+                                                       'branches', 'branch_levels', 'branch_latest_cus'])
+
+
+def parse_build(build):
+    # "14.0.3294.2" -> (14, 0, 3294, 2), or None if it doesn't look like a build number
     import re
-    release_date_regex = re.compile("^([0-9-]{10}).*new$")
-    for date in app_dataframe['Release Date']:
-
-        if release_date_regex.match(date):
-            l_release_date = date.split() 
-            # the last update's release date: in form "2020-05-28".
-            l_release_date = l_release_date[0]
-            return str(l_release_date)
-        
-        
-def highest_sp(versions_dataframe):
+    match = re.match(r"\s*([0-9]+(?:\.[0-9]+)+)", str(build))
+    if not match:
+        return None
+    return tuple(int(part) for part in match.group(1).split('.'))
+
+
+def build_index(catalog):
+    # CatalogIndex for a dataframe of a sqlserverbuilds page, made once per webpage
+    # release_date is just the date part of the "Release Date" column (like "2020-04-07" from "2020-04-07 *new")
     import re
-    service_pack_regex = re.compile("Service Pack [1-9]{1}")
-    sp_regex = re.compile("SP[1-9]{1}")
-    
-    service_pack = 'SP'
-    service_pack2 = 'Service Pack '
-
-    temp_pack1 = service_pack
-    temp_pack2 = service_pack2
-
-    for description in versions_dataframe['KB / Description']:
-        # a service pack in the form "Server Pack _" is present in the table
-        if service_pack_regex.search(description): 
-            service_packs1 = re.findall(sp_regex,description)
-            for pack in service_packs1:
-                if pack > temp_pack1: # compare to hard-coded value
-                    temp_pack1 = pack
-
-        # a service pack in the form "SP_" is present in the table
-        if sp_regex.search(description):
-            service_packs2 = re.findall(service_pack_regex,description)
-            for pack2 in service_packs2:
-                if pack2 > temp_pack2: # compare to hard-coded value
-                    temp_pack2 = pack2
-    
-    # find the highest service pack
-    if temp_pack2 > service_pack2:
-        temp_pack2 = 'SP' + temp_pack2[13] # put version in normal "SP_" format
-        if temp_pack1 > service_pack and temp_pack1 >= temp_pack2:
-            return temp_pack1
-        elif temp_pack1 > service_pack and temp_pack1 < temp_pack2:
-            return temp_pack2
+    cumulative_update_regex = re.compile("cumulative update", re.IGNORECASE)
+    security_update_regex = re.compile(r"security update|\bGDR\b", re.IGNORECASE)
+
+    builds = {}
+    numeric = {}
+    for build, release_date, description in zip(catalog['Build'], catalog['Release Date'], catalog['KB / Description']):
+        build = str(build)
+        # if a build is listed twice, the first row wins
+        if build in builds:
+            continue
+        release_date = str(release_date).split()
+        builds[build] = BuildInfo(release_date[0] if release_date else '', str(description))
+        parsed = parse_build(build)
+        if parsed is not None and parsed not in numeric:
+            numeric[parsed] = builds[build]
+
+    sorted_builds = sorted(numeric)
+    sorted_info = [numeric[build] for build in sorted_builds]
+    cumulative_updates = [build for build in sorted_builds if cumulative_update_regex.search(numeric[build].description)]
+    security_updates = [build for build in sorted_builds if security_update_regex.search(numeric[build].description)]
+    security_kbs = [security_kb(numeric[build].description, build) for build in security_updates]
+    branches, branch_levels, branch_latest_cus = build_branches(sorted_builds, sorted_info, cumulative_updates)
+    return CatalogIndex(builds, sorted_builds, sorted_info, cumulative_updates, security_updates, security_kbs,
+                        branches, branch_levels, branch_latest_cus)
+
+
+def build_branches(sorted_builds, sorted_info, cumulative_updates):
+    # (branches, branch_levels, branch_latest_cus) for a CatalogIndex - made once when the webpage is loaded
+    # every service pack starts at the lowest build that mentions it ("Service Pack 2" or "SP2"), so its CUs and
+    # security updates (which come later, with higher builds) don't move it - RTM starts at the lowest build
+    import re
+    import bisect
+    service_pack_regex = re.compile(r"\bService Pack ([0-9]+)([a-z]?)\b|\bSP([0-9]+)([a-z]?)\b")
+
+    if not sorted_builds:
+        return [], [], []
+
+    first_builds = {}
+    for build, info in zip(sorted_builds, sorted_info):
+        for match in service_pack_regex.finditer(info.description):
+            if match.group(1):
+                level = 'SP' + match.group(1) + match.group(2)
+            else:
+                level = 'SP' + match.group(3) + match.group(4)
+            if level not in first_builds:
+                first_builds[level] = build
+
+    branches = [sorted_builds[0]]
+    branch_levels = ['RTM']
+    for level in sorted(first_builds, key=service_pack_number):
+        # a service pack that starts below the one before it is a mistake on the webpage, leave it out
+        if first_builds[level] > branches[-1]:
+            branches.append(first_builds[level])
+            branch_levels.append(level)
+
+    branch_latest_cus = []
+    for position, start in enumerate(branches):
+        if position + 1 < len(branches):
+            end = bisect.bisect_left(cumulative_updates, branches[position + 1])
+        else:
+            end = len(cumulative_updates)
+        if end > 0 and cumulative_updates[end - 1] >= start:
+            branch_latest_cus.append(cumulative_updates[end - 1])
+        else:
+            branch_latest_cus.append(None)
+
+    return branches, branch_levels, branch_latest_cus
+
+
+def service_pack_number(level):
+    # "SP2" -> (2, ''), "SP5a" -> (5, 'a'), "RTM" -> (0, ''), for comparing service packs - None if it isn't one of those
+    import re
+    if level is None:
+        return None
+    level = str(level).strip()
+    if level.upper() == 'RTM':
+        return (0, '')
+    match = re.match(r"SP([0-9]+)([a-z]?)$", level, re.IGNORECASE)
+    if not match:
+        return None
+    return (int(match.group(1)), match.group(2).lower())
+
+
+def newest_service_pack(index):
+    # highest service pack on the webpage, or '' if there aren't any
+    if len(index.branch_levels) < 2:
+        return ''
+    return index.branch_levels[-1]
+
+
+def branch_status(index, build):
+    # (product level the build belongs to, newest cumulative update for that service pack or None, newest service pack or '')
+    # in one bisect of the service pack ladder
+    import bisect
+    if not index.branches:
+        return '', None, ''
+    position = max(0, bisect.bisect_right(index.branches, build) - 1)
+    return index.branch_levels[position], index.branch_latest_cus[position], newest_service_pack(index)
+
+
+def security_kb(description, build):
+    # "KB4535288 Security update for SQL Server 2014 SP3 CU4" -> "KB4535288" (or the build if there's no KB number)
+    import re
+    match = re.search(r"KB\s?([0-9]{6,7})", description)
+    if match:
+        return 'KB' + match.group(1)
+    return '.'.join(str(part) for part in build)
+
+
+def nearest_known_build(index, build):
+    # (build, BuildInfo) of the newest build on the webpage that is not newer than build
+    # (or the oldest build on the webpage, if build is older than all of them)
+    import bisect
+    position = bisect.bisect_right(index.sorted_builds, build) - 1
+    if position < 0:
+        position = 0
+    return index.sorted_builds[position], index.sorted_info[position]
+
+
+def servicing_track(index, build):
+    # (lowest, highest) builds of the servicing track the build is on, highest is None for "no limit"
+    # every service pack (or RTM) has two tracks: GDR - only security fixes, the builds from the start of the service
+    # pack up to its first cumulative update - and CU - its cumulative updates and the security updates made for them
+    # a server only gets the security updates of its own track (a GDR server isn't missing a CU's security update)
+    import bisect
+    if not index.branches:
+        return (), None
+    position = max(0, bisect.bisect_right(index.branches, build) - 1)
+    start = index.branches[position]
+    end = index.branches[position + 1] if position + 1 < len(index.branches) else None
+
+    # the first cumulative update of the service pack, if it has any
+    first = bisect.bisect_left(index.cumulative_updates, start)
+    if first == len(index.cumulative_updates) or (end is not None and index.cumulative_updates[first] >= end):
+        return start, end
+    first_cu = index.cumulative_updates[first]
+    if build < first_cu:
+        return start, first_cu
+    return first_cu, end
+
+
+def security_update_needed(index, build):
+    # the KB of the newest security update on the build's own servicing track (see servicing_track) if the build is
+    # older than it (a few bisects, no scanning the descriptions), 'False' if the build has every security update of
+    # its track (or the track has none), '' if the webpage doesn't list any security updates at all
+    import bisect
+    if not index.security_updates:
+        return ''
+    low, high = servicing_track(index, build)
+    newest = len(index.security_updates) if high is None else bisect.bisect_left(index.security_updates, high)
+    newest -= 1
+    if newest < 0 or index.security_updates[newest] < low or index.security_updates[newest] <= build:
+        return 'False'
+    return index.security_kbs[newest]
+
+
+def cumulative_updates_behind(index, build):
+    # how many cumulative updates on the webpage are newer than build
+    import bisect
+    return len(index.cumulative_updates) - bisect.bisect_right(index.cumulative_updates, build)
+
+
+# SQL Server version -> (major, minor) of its product version, and its page on sqlserverbuilds.blogspot.com
+sqlserverbuilds_url = 'https://sqlserverbuilds.blogspot.com'
+sql_versions = [
+    ('2019', (15, 0), '/2019/01/sql-server-2019-versions.html'),
+    ('2017', (14, 0), '/2017/01/sql-server-2017-versions.html'),
+    ('2016', (13, 0), '/2016/01/sql-server-2016-versions.html'),
+    ('2014', (12, 0), '/2014/01/sql-server-2014-versions.html'),
+    ('2012', (11, 0), '/2012/01/sql-server-2012-versions.html'),
+    ('2008R2', (10, 50), '/2008/05/sql-server-2008-r2-versions.html'),
+    ('2008', (10, 0), '/2008/01/sql-server-2008-versions.html'),
+    ('2005', (9, 0), '/2005/01/sql-server-2005-versions.html'),
+    ('2000', (8, 0), '/2000/01/sql-server-2000-versions.html'),
+    ('7_0', (7, 0), '/2007/01/sql-server-7.html'),
+    ('6_5', (6, 50), '/2006/05/sql-server-6-5.html'),
+]
+# (major, minor) -> SQL Server version, like (14, 0) -> '2017'
+sql_version_families = dict((family, release_type) for release_type, family, webpage in sql_versions)
+
+
+def sql_release_type(product_version):
+    # 2019, 2017, 6_5, etc. for a product version like 14.0.3294.2, or None if it isn't a version we know about
+    build = parse_build(product_version)
+    if build is None:
+        return None
+    return sql_version_families.get(build[:2])
+
+
+def prefetch_catalogs(release_types, cache_dir, cache_ttl_hours=24, offline=False, refresh=False,
+                      catalog_url=None, timeout=30, retries=3, max_workers=8, sources=None):
+    # load the webpages for all of the SQL versions at once instead of one after another
+    # catalog_url replaces https://sqlserverbuilds.blogspot.com (like a local web server with saved copies of the pages,
+    # or a directory with them, like samples/pages)
+    # sources gets where each webpage came from (see load_catalog)
+    import os
+    import pathlib
+    from concurrent.futures import ThreadPoolExecutor
+
+    if catalog_url is None:
+        catalog_url = sqlserverbuilds_url
+    elif os.path.isdir(catalog_url):
+        catalog_url = pathlib.Path(catalog_url).resolve().as_uri()
+    webpages = {}
+    for release_type, family, webpage in sql_versions:
+        webpages[release_type] = catalog_url.rstrip('/') + webpage
+
+    catalogs = {}
+    if not release_types:
+        return catalogs
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(release_types))) as pool:
+        futures = {}
+        for release_type in release_types:
+            futures[release_type] = pool.submit(load_catalog, release_type, webpages[release_type], cache_dir,
+                                                cache_ttl_hours=cache_ttl_hours, offline=offline, refresh=refresh,
+                                                timeout=timeout, retries=retries, sources=sources)
+        for release_type in release_types:
+            catalogs[release_type] = futures[release_type].result()
+
+    return catalogs
+
+
+def load_catalog(release_type, webpage, cache_dir, cache_ttl_hours=24, offline=False, refresh=False, timeout=30, retries=3,
+                 sources=None):
+    # dataframe with the Build, Release Date and KB / Description columns of a sqlserverbuilds page
+    # served from the cache directory when the cached copy is younger than cache_ttl_hours -
+    # offline never touches the network, refresh always does
+    # sources[release_type] is set to 'cache', 'download', or 'old cache' (when the download failed)
+    import time
+
+    if sources is None:
+        sources = {}
+
+    cache_file = catalog_cache_file(cache_dir, release_type, webpage)
+    cached = read_cached_catalog(cache_file, webpage)
+
+    if cached is not None and not refresh:
+        fresh = time.time() - cached['fetched'] < cache_ttl_hours * 3600
+        if fresh or offline:
+            sources[release_type] = 'cache'
+            return catalog_dataframe(cached['columns'])
+
+    if offline:
+        raise FileNotFoundError('There is no cached copy of the SQL Server ' + release_type + ' builds page in ' + cache_dir + 
+                                '. Run once without --offline (or copy the cache directory over from a machine that can reach ' + webpage + ').')
+
+    try:
+        columns = fetch_catalog(webpage, timeout, retries)
+    except Exception as error:
+        if cached is None:
+            raise
+        # the page can't be reached right now, an old copy is better than nothing
+        print('Could not download ' + webpage + ' (' + str(error) + '), using the cached copy from ' + 
+              time.strftime("%m-%d-%Y %H:%M", time.localtime(cached['fetched'])))
+        sources[release_type] = 'old cache'
+        return catalog_dataframe(cached['columns'])
+
+    write_cached_catalog(cache_file, webpage, columns)
+    sources[release_type] = 'download'
+    return catalog_dataframe(columns)
+
+
+def fetch_catalog(webpage, timeout=30, retries=3):
+    # download a sqlserverbuilds page, keeping only the columns the program reads
+    # gives up on a request after timeout seconds and tries again up to retries more times
+    import io
+    import time
+    import urllib.request
+    import pandas as pd
+
+    attempt = 0
+    while True:
+        try:
+            with urllib.request.urlopen(webpage, timeout=timeout) as response:
+                html = response.read().decode('utf-8', errors='replace')
+            break
+        except OSError:
+            if attempt >= retries:
+                raise
+            attempt += 1
+            # wait a little longer after every failure (1, 2, 4... seconds)
+            time.sleep(2 ** (attempt - 1))
+
+    dataframe = pd.read_html(io.StringIO(html))[0]
+    columns = {}
+    for column in ['Build', 'Release Date', 'KB / Description']:
+        columns[column] = [str(value) for value in dataframe[column].fillna('')]
+    return columns
+
+
+def catalog_dataframe(columns):
+    import pandas as pd
+    return pd.DataFrame(columns)
+
+
+def catalog_cache_file(cache_dir, release_type, webpage):
+    # 2017.json for the sqlserverbuilds page, and a file of its own (2017-<hash of the url>.json) for any other
+    # copy of the page (--catalog-url), so a run against a stand-in never replaces the real page in the cache
+    import os
+    import hashlib
+
+    if webpage.startswith(sqlserverbuilds_url + '/'):
+        return os.path.join(cache_dir, release_type + '.json')
+    return os.path.join(cache_dir, release_type + '-' + hashlib.sha1(webpage.encode('utf-8')).hexdigest()[:12] + '.json')
+
+
+def read_cached_catalog(cache_file, webpage=None):
+    # the cached page, or None if there isn't one (or it was downloaded from somewhere else than webpage)
+    import json
+
+    try:
+        with open(cache_file, 'r') as cache:
+            cached = json.load(cache)
+    except (OSError, ValueError):
+        return None
+    if 'fetched' not in cached or 'columns' not in cached:
+        return None
+    if webpage is not None and cached.get('url') != webpage:
+        return None
+    return cached
+
+
+def write_cached_catalog(cache_file, webpage, columns):
+    import json
+    import time
+
+    # write to a temporary file first so a run that gets interrupted never leaves half a catalog behind
+    with replacing_file(cache_file) as cache:
+        json.dump({'url': webpage, 'fetched': time.time(), 'columns': columns}, cache)
+
+
+def parse_sccm_output(reader):
+    # turns the "SERVERn<tab>1<tab>0<tab>[ ... ]" blocks of the SCCM output into ServerRecords,
+    # one block at a time (one record for every SQL Server instance in the block) - reader can be a
+    # file object or any iterable of lines
+    import re
+
+    # the line with the server name always contains a 1 and a 0 separated by a tab
+    server_header_regex = re.compile(r"^(\S+)\t1\t0(?:\t(.*))?$")
+
+    server_name = None
+    header_text = ""
+    block = []
+
+    for line in reader:
+        # only the server name lines have tabs in them, so don't bother with the regex for the rest
+        header = '\t' in line and server_header_regex.match(line.rstrip('\r\n'))
+        if header:
+            if server_name is not None:
+                yield from decode_server_records(server_name, header_text, block)
+            server_name = header.group(1)
+            header_text = header.group(2) or ""
+            block = []
+        elif server_name is not None:
+            block.append(line)
+
+    if server_name is not None:
+        yield from decode_server_records(server_name, header_text, block)
+
+
+def count_records(records):
+    # counters for the text file statistics from a list of ServerRecords
+    # a server with more than one SQL Server instance has a record for each of them but is only counted once -
+    # with SQL if any of its instances answered, and sql_instances is how many instances answered altogether
+    counts = collections.Counter(servers=0, has_sql=0, not_with_sql=0, gave_warning=0, didnot_run=0, sql_instances=0)
+    # server -> (2 with SQL, 1 without, 0 didn't run; gave a warning)
+    servers = {}
+    for record in records:
+        server = record.server.split('\\', 1)[0]
+        if record.query_ran is None:
+            state = 0
+        elif record.query_ran:
+            state = 2
+            counts['sql_instances'] += 1
+        else:
+            state = 1
+        before = servers.get(server, (0, False))
+        servers[server] = (max(before[0], state), before[1] or bool(record.warning))
+    for state, warning in servers.values():
+        counts['servers'] += 1
+        if state == 0:
+            counts['didnot_run'] += 1
+        elif state == 2:
+            counts['has_sql'] += 1
+        else:
+            counts['not_with_sql'] += 1
+            if warning:
+                counts['gave_warning'] += 1
+    return counts
+
+
+def parse_sccm_file(filename, workers=1, use_mmap=False):
+    # (list of ServerRecords, counters) for a whole SCCM output file
+    # with more than one worker the file is cut into pieces on server boundaries and the pieces are parsed
+    # in separate processes - the records come back in the same order as in the file
+    # use_mmap scans the raw bytes of the file instead of decoding every line (see parse_sccm_mmap)
+    import os
+
+    # a compressed file can't be cut into pieces or memory-mapped, so it's decompressed as it's read, in one go
+    compression = compression_of(filename)
+    if compression is not None:
+        records = list(parse_sccm_output(read_lines(filename, compression=compression)))
+        return records, count_records(records)
+
+    if workers is None or workers < 1:
+        workers = os.cpu_count() or 1
+
+    # not worth starting processes for small files
+    size = os.path.getsize(filename)
+    if workers == 1 or size < 16 * 1024 * 1024:
+        return parse_sccm_shard(filename, 0, size, use_mmap)
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    boundaries = shard_boundaries(filename, size, workers)
+    records = []
+    counts = collections.Counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        shards = [pool.submit(parse_sccm_shard, filename, start, end, use_mmap) for start, end in zip(boundaries, boundaries[1:])]
+        for shard in shards:
+            shard_records, shard_counts = shard.result()
+            records.extend(shard_records)
+            counts.update(shard_counts)
+    return records, counts
+
+
+def shard_boundaries(filename, size, pieces):
+    # byte offsets that cut the file into about equal pieces, each starting on a "NAME<tab>1<tab>0" line
+    import re
+    server_header_regex = re.compile(rb"^\S+\t1\t0(?:\t|\r?\n|$)")
+
+    boundaries = [0]
+    with open(filename, 'rb') as reader:
+        for piece in range(1, pieces):
+            offset = max(size * piece // pieces, boundaries[-1])
+            reader.seek(offset)
+            # skip the rest of the line we landed in the middle of
+            if offset > 0:
+                reader.readline()
+            while True:
+                line_start = reader.tell()
+                line = reader.readline()
+                if not line:
+                    line_start = size
+                    break
+                if server_header_regex.match(line):
+                    break
+            if line_start > boundaries[-1]:
+                boundaries.append(line_start)
+    boundaries.append(size)
+    return boundaries
+
+
+def parse_sccm_shard(filename, start, end, use_mmap=False):
+    # (list of ServerRecords, counters) for the servers between byte offsets start and end of the file
+    if use_mmap:
+        records = list(parse_sccm_mmap(filename, start, end))
     else:
-        return temp_pack1
-    
+        records = list(parse_sccm_output(read_lines(filename, start, end)))
+    return records, count_records(records)
+
+
+def parse_sccm_mmap(filename, start=0, end=None):
+    # same ServerRecords as parse_sccm_output, but the file is memory-mapped and searched with bytes regular
+    # expressions - only the server name, the query status, the warning and the "Result" values are ever decoded
+    import mmap
+    import locale
+
+    with open(filename, 'rb') as reader:
+        reader.seek(0, 2)
+        size = reader.tell()
+        if end is None or end > size:
+            end = size
+        if start >= end:
+            return
+        encoding = locale.getpreferredencoding(False)
+        with mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            # one pass over the bytes - every match is a server name line, an "SQL Instance" line, a "Did SQL Query Run?"
+            # line, a Result/Query pair or a -Compact line
+            # anything before the first server name line (like a stray "Did SQL Query Run?" line) is skipped,
+            # the same as parse_sccm_output does
+            server_name = None
+            query_ran = None
+            warning = b''
+            instances = []
+            results = None
+            for token in mmap_token_regex.finditer(data, start, end):
+                # the number of the last group that matched says what kind of token it is (see below)
+                kind = token.lastindex
+                if kind <= 2:
+                    if server_name is not None:
+                        yield from mmap_server_records(server_name, query_ran, warning, instances, encoding)
+                    server_name = token.group(1)
+                    header_text = token.group(2) or b''
+                    # a -Compact line has the whole server on it
+                    if compact_marker_bytes in header_text:
+                        yield from decode_compact_records(server_name.decode(encoding, errors='replace'),
+                                                          header_text.decode(encoding, errors='replace'))
+                        server_name = None
+                        query_ran = None
+                        continue
+                    # [[instance, query ran, {query: result}]] for every SQL Server instance of the server,
+                    # and the results of the one being read
+                    instances = []
+                    results = None
+                    bracket = header_text.find(b'[')
+                    # sometimes PowerShell script will fail entirely, and 
+                    # there will not even be "Did SQL Query Run?" output
+                    if bracket == -1:
+                        query_ran = None
+                        warning = b''
+                    else:
+                        query_ran = False
+                        warning = header_text[:bracket].strip()
+                elif query_ran is None:
+                    continue
+                elif kind == 6:
+                    # the output from before there were instances only has one, without a name
+                    if results is None:
+                        results = {}
+                        instances.append([b'', False, results])
+                    results[token.group(6)] = token.group(5)
+                elif kind == 4:
+                    if results is None or instances[-1][1]:
+                        results = {}
+                        instances.append([b'', False, results])
+                    instances[-1][1] = token.group(4) == b'True'
+                elif kind == 3:
+                    results = {}
+                    instances.append([token.group(3), False, results])
+                else:
+                    instances.append(mmap_compact_instance(token.group(7)))
+                    results = instances[-1][2]
+            if server_name is not None:
+                yield from mmap_server_records(server_name, query_ran, warning, instances, encoding)
+
+
+# bytes regular expression for parse_sccm_mmap, matches one of
+#   the line with the server name (1), and whatever follows "1<tab>0<tab>" (2)
+#   "SQL Instance : NAME" (3)
+#   "Did SQL Query Run? : True" (4)
+#   a "Result" (5) and its "Query" label (6)
+#   a -Compact line inside the JSON array, when there's more than one instance (7)
+mmap_token_regex = re.compile(rb'^([^\s]+)\t1\t0(?:\t([^\r\n]*))?\r?$'
+                              rb'|"(?:SQL Instance : ([^"]*)"'
+                              rb'|Did SQL Query Run\? : (\w+)"'
+                              rb'|Result":\s*("[^"\\]*(?:\\.[^"\\]*)*"|null),\s*"Query":\s*"([^"]*)"'
+                              rb'|MSSQLv1\|([^"\r\n]*)")', re.MULTILINE)
+compact_marker_bytes = b'MSSQLv1|'
+
+
+def mmap_compact_instance(fields):
+    # [instance, query ran, {query: result}] from the bytes after "MSSQLv1|" on a -Compact line
+    fields = fields.rstrip(b' \t\r\n",]').split(b'|')
+    fields += [b''] * (6 - len(fields))
+    if fields[1] != b'True':
+        return [fields[0], False, {}]
+    return [fields[0], True, {b'Edition': fields[2], b'Product Version': fields[3], b'Product Level': fields[4]}]
+
+
+def mmap_server_records(server_name, query_ran, warning, instances, encoding):
+    # ServerRecords from the raw bytes parse_sccm_mmap picked out for one server, one for every instance
+    import json
+
+    server_name = server_name.decode(encoding, errors='replace')
+    if query_ran is None:
+        return [ServerRecord(server_name, None, '', '', '', '')]
+    warning = warning.decode(encoding, errors='replace')
+
+    records = []
+    for instance, instance_ran, results in instances:
+        values = {}
+        for query, result in results.items():
+            if result == b'null':
+                result = ''
+            elif result[:1] != b'"':
+                # from a -Compact line, there are no quotes around it
+                result = result.decode(encoding, errors='replace')
+            elif b'\\' in result:
+                result = json.loads(result.decode(encoding, errors='replace'))
+            else:
+                result = result[1:-1].decode(encoding, errors='replace')
+            values[query.decode(encoding, errors='replace')] = result
+        records.append(ServerRecord(instance_server_name(server_name, instance.decode(encoding, errors='replace')), instance_ran,
+                                    values.get('Edition', ''),
+                                    values.get('Product Version', ''),
+                                    values.get('Product Level', ''),
+                                    warning))
+    return records or [ServerRecord(server_name, False, '', '', '', warning)]
+
+
+def read_lines(filename, start=0, end=None, compression=None):
+    # lines of the file between byte offsets start and end, decoded the same way open(filename, 'r') would
+    # the bytes are read and decoded in large blocks, which is much faster than one line at a time
+    # a compressed file (see compression_of) is decompressed block by block, always the whole file
+    import codecs
+    import locale
+
+    decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors='replace')
+    pending = ''
+    # how many more bytes to read, None for the rest of the file
+    remaining = None
+    if compression is None:
+        reader = open(filename, 'rb')
+        reader.seek(start)
+        if end is not None:
+            remaining = end - start
+    else:
+        reader = open_decompressed(filename, compression)
+    with reader:
+        while remaining is None or remaining > 0:
+            block = reader.read(4 * 1024 * 1024 if remaining is None else min(4 * 1024 * 1024, remaining))
+            if not block:
+                break
+            if remaining is not None:
+                remaining -= len(block)
+            lines = (pending + decoder.decode(block)).split('\n')
+            # the last piece is the start of a line that continues in the next block
+            pending = lines.pop()
+            for line in lines:
+                yield line + '\n'
+    pending = pending + decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+# the first bytes of each kind of compressed file, and what compression_of calls it
+compression_magic = [(b'\x1f\x8b', 'gzip'), (b'\xfd7zXZ\x00', 'xz'), (b'BZh', 'bz2'), (b'\x28\xb5\x2f\xfd', 'zstd')]
+
+
+def compression_of(filename):
+    # 'gzip', 'xz', 'bz2' or 'zstd' if the file is compressed (whatever it's called), None for a normal text file
+    with open(filename, 'rb') as reader:
+        start = reader.read(6)
+    for magic, compression in compression_magic:
+        if start.startswith(magic):
+            return compression
+    return None
+
+
+def open_decompressed(filename, compression):
+    # binary file object that gives the decompressed bytes of the file as they're read
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(filename, 'rb')
+    if compression == 'xz':
+        import lzma
+        return lzma.open(filename, 'rb')
+    if compression == 'bz2':
+        import bz2
+        return bz2.open(filename, 'rb')
+
+    # zstd is built into Python from 3.14, otherwise it needs the zstandard package
+    try:
+        from compression import zstd
+        return zstd.open(filename, 'rb')
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(filename + ' is compressed with zstd - install the zstandard package (pip install zstandard) '
+                          'or decompress it first')
+    # zstd -T / pzstd (and cat a.zst b.zst) write several frames, read all of them and not just the first one
+    return zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True, read_across_frames=True)
+
+
+def decode_server_records(server_name, header_text, block):
+    # ServerRecords for one server, one for every SQL Server instance on it
+    # header_text is whatever followed "1<tab>0<tab>" - a WARNING (if any) and the start of the JSON array
+    import json
+
+    # getMSSQLVersioninSCCM.ps1 -Compact puts each instance on one line - on the server name line itself
+    # when there's only one, otherwise SCCM shows them as a JSON array of strings
+    if compact_marker in header_text or (block and compact_marker in block[0]):
+        return decode_compact_records(server_name, header_text + ''.join(block))
+
+    bracket = header_text.find('[')
+    # sometimes PowerShell script will fail entirely, and 
+    # there will not even be "Did SQL Query Run?" output
+    if bracket == -1:
+        return [ServerRecord(server_name, None, '', '', '', '')]
+
+    warning = header_text[:bracket].strip()
+    text = header_text[bracket:] + ''.join(block)
+
+    try:
+        items = json.loads(text)
+    except ValueError:
+        # output got cut off or mangled when it was copied out of SCCM - pick out what we can
+        items = decode_server_block_fallback(text)
+
+    # [[instance, query ran, {query: result}]] - every instance starts with an "SQL Instance : NAME" line,
+    # the output from before there were instances only has one, without a name
+    instances = []
+    results = None
+    for item in items:
+        if isinstance(item, dict):
+            if results is None:
+                results = {}
+                instances.append(['', False, results])
+            # "Query" is the label from the PowerShell script ("Edition", "Product Version", "Product Level")
+            results[str(item.get('Query'))] = '' if item.get('Result') is None else str(item.get('Result'))
+        elif isinstance(item, str):
+            if item.startswith(instance_label):
+                results = {}
+                instances.append([item[len(instance_label):].strip(), False, results])
+            elif item.find("Did SQL Query Run?") != -1:
+                if results is None or instances[-1][1]:
+                    results = {}
+                    instances.append(['', False, results])
+                instances[-1][1] = item.find("True") != -1
+
+    if not instances:
+        return [ServerRecord(server_name, False, '', '', '', warning)]
+    return [ServerRecord(instance_server_name(server_name, instance), query_ran,
+                         results.get('Edition', ''),
+                         results.get('Product Version', ''),
+                         results.get('Product Level', ''),
+                         warning)
+            for instance, query_ran, results in instances]
+
+
+# what the PowerShell script puts in front of the name of each SQL Server instance
+instance_label = 'SQL Instance : '
+
+
+def instance_server_name(server_name, instance):
+    # the default instance is just the server, a named one is SERVER\INSTANCE like when connecting to it
+    if instance in ('', 'MSSQLSERVER'):
+        return server_name
+    return server_name + '\\' + instance
+
+
+# start of the line getMSSQLVersioninSCCM.ps1 -Compact writes for every SQL Server instance:
+#   MSSQLv1|instance|query ran|edition|product version|product level|error
+compact_marker = 'MSSQLv1|'
+
+
+def decode_compact_records(server_name, text):
+    # ServerRecords from the -Compact lines of a server - just splitting on |, no JSON to decode
+    # SCCM can put a WARNING in front of them, and quotes or brackets around them if it shows them as JSON
+    lines = text.split(compact_marker)
+    warning = lines[0].rstrip(' ["').strip()
+
+    records = []
+    for line in lines[1:]:
+        fields = line.rstrip(' \t\r\n",]').split('|')
+        if len(fields) < 6:
+            fields += [''] * (6 - len(fields))
+        if fields[1] != 'True':
+            # same as the full output - no results when the query didn't run (the error is only for reading the file)
+            records.append(ServerRecord(instance_server_name(server_name, fields[0]), False, '', '', '', warning))
+        else:
+            records.append(ServerRecord(instance_server_name(server_name, fields[0]), True, fields[2], fields[3], fields[4], warning))
+    return records
+
+
+def decode_server_block_fallback(text):
+    # same items json.loads would give, pulled out with regular expressions
+    import re
+
+    items = []
+    for item in re.finditer(r'"((?:SQL Instance|Did SQL Query Run\?) : [^"]*)"|"Result":\s*"([^"]*)",\s*"Query":\s*"([^"]*)"', text):
+        if item.group(1) is not None:
+            items.append(item.group(1))
+        else:
+            items.append({'Result': item.group(2), 'Query': item.group(3)})
+    return items
 
     
     
 if __name__ == '__main__':
-    main()
+    import os
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Parse the output of getMSSQLVersioninSCCM.ps1 and find out-of-date MSSQL versions.')
+    parser.add_argument('inputs', nargs='*', metavar='FILE',
+                        help='output files from the PowerShell script, wildcards allowed (default "SSCM TEXTFILE HERE.txt" in the home directory). '
+                             'Servers found in more than one file are only reported once. Files compressed with gzip, xz, bz2 or zstd '
+                             'are read without unpacking them first')
+    parser.add_argument('--per-input-reports', action='store_true',
+                        help='with more than one FILE, also write the reports for each file on its own, in a folder named after the file')
+    parser.add_argument('--output-dir', default=None,
+                        help='write the output files here (default a new folder named after the date and time in the home directory)')
+    parser.add_argument('--parse-only', action='store_true',
+                        help='only parse the files and write allScannedServers.csv, without looking up any versions')
+    parser.add_argument('--columnar', choices=['arrow', 'parquet', 'both'], default=None,
+                        help='also write the results as Arrow IPC (.arrow) and/or Parquet files with typed columns, '
+                             'for dashboards (needs pyarrow)')
+    parser.add_argument('--offline', action='store_true',
+                        help='never download the sqlserverbuilds pages, only use the cached copies')
+    parser.add_argument('--refresh-catalogs', action='store_true',
+                        help='download the sqlserverbuilds pages again even if the cached copies are still fresh')
+    parser.add_argument('--cache-ttl', type=float, default=24, metavar='HOURS',
+                        help='how long a cached sqlserverbuilds page is used before it is downloaded again (default 24)')
+    parser.add_argument('--cache-dir', default=None,
+                        help='where the cached sqlserverbuilds pages are kept (default ~/.mssql-version-sccm/catalogs)')
+    parser.add_argument('--catalog-url', default=None, metavar='URL',
+                        help='get the version pages from here instead of https://sqlserverbuilds.blogspot.com (like a local copy of the site, '
+                             'or a directory of saved pages like samples/pages) - '
+                             'they are cached separately from the real pages')
+    parser.add_argument('--catalog-timeout', type=float, default=30, metavar='SECONDS',
+                        help='give up on a version page download after this many seconds (default 30)')
+    parser.add_argument('--catalog-retries', type=int, default=3,
+                        help='how many times a failed version page download is tried again (default 3)')
+    parser.add_argument('--current-within', type=int, default=2, metavar='MONTHS',
+                        help='a server counts as current if its build is less than this many months older than the newest update (default 2)')
+    parser.add_argument('--staleness-buckets', default='6,12,24', metavar='MONTHS,MONTHS,...',
+                        help='month boundaries for counting out-of-date servers in the stats file (default 6,12,24)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='parse the SCCM output file in this many processes (0 = one per CPU), for very large files')
+    parser.add_argument('--mmap', action='store_true',
+                        help='memory-map the SCCM output file and scan its bytes directly (faster and lighter for multi-GB files)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='reuse last run\'s results for servers that haven\'t changed, and write changesSinceLastRun.csv')
+    parser.add_argument('--state-file', default=None,
+                        help='where --incremental keeps what every server looked like (default ~/.mssql-version-sccm/state.json)')
+    parser.add_argument('--history', action='store_true',
+                        help='add this run\'s results to the history database')
+    parser.add_argument('--history-db', default=None,
+                        help='the history database (default ~/.mssql-version-sccm/history.sqlite)')
+    parser.add_argument('--profile', default=None, metavar='FILE',
+                        help='write how long every phase of the run took (and records, catalog cache hits, bytes read and written) to FILE as JSON')
+    parser.add_argument('--profile-with', choices=['cprofile', 'tracemalloc'], default=None,
+                        help='with --profile, also run cProfile (saved to FILE.pstats) or tracemalloc (memory peak of every phase)')
+    parser.add_argument('--watch', metavar='DIRECTORY', default=None,
+                        help='keep running and write the reports for every new output file that shows up in DIRECTORY, '
+                             'each in its own folder in --output-dir (default DIRECTORY/reports)')
+    parser.add_argument('--watch-pattern', default='*.txt', help='with --watch, which files to pick up (default *.txt, use *.txt* to pick up compressed ones too)')
+    parser.add_argument('--poll-seconds', type=float, default=2, help='with --watch, how often to check DIRECTORY (default 2)')
+    parser.add_argument('--catalog-refresh', type=float, default=60, metavar='MINUTES',
+                        help='with --watch or --serve, how often the sqlserverbuilds pages kept in memory are loaded again (default 60)')
+    parser.add_argument('--serve', metavar='[HOST:]PORT', default=None,
+                        help='instead of parsing anything, answer build lookups over HTTP (like /lookup?build=14.0.3294.2) '
+                             'until ctrl-c - HOST is 127.0.0.1 unless given')
+    parser.add_argument('--catalog-snapshot', default=None, metavar='FILE',
+                        help='read the builds of every SQL version from a snapshot made with --build-snapshot, instead of the webpages')
+    parser.add_argument('--build-snapshot', default=None, metavar='FILE',
+                        help='load the sqlserverbuilds page of every SQL version (using the cache like a normal run) '
+                             'and save them all in one compact snapshot FILE for --catalog-snapshot, then exit')
+    parser.add_argument('--trend', metavar='SERVER', default=None,
+                        help='show how SERVER\'s version and patch lag changed over every run in the history database, then exit')
+    parser.add_argument('--lag-histogram', nargs='?', const='', default=None, metavar='SQL_VERSION',
+                        help='show how far behind the servers were in the latest run in the history database '
+                             '(optionally just one SQL version like 2017), then exit')
+    args = parser.parse_args()
+
+    staleness_buckets = tuple(sorted(int(months) for months in args.staleness_buckets.split(',')))
+    columnar = {None: None, 'arrow': ('arrow',), 'parquet': ('parquet',), 'both': ('arrow', 'parquet')}[args.columnar]
+
+    if args.trend is not None or args.lag_histogram is not None:
+        history_db = args.history_db if args.history_db is not None else default_history_db()
+        if args.trend is not None:
+            print('Run time             Product Version   Product Level   Months Behind   CUs Behind   Security Update Needed')
+            for run_time, product_version, product_level, months, cus_behind, security_update in server_trend(history_db, args.trend):
+                print(run_time.ljust(21) + str(product_version).ljust(18) + str(product_level).ljust(16) +
+                      ('' if months is None else str(months)).ljust(16) + str(cus_behind).ljust(13) + (security_update or ''))
+        if args.lag_histogram is not None:
+            run_time, histogram = lag_histogram(history_db, (args.current_within,) + staleness_buckets, args.lag_histogram or None)
+            if run_time is None:
+                print('There are no runs in ' + history_db + ' yet - run with --history first.')
+            else:
+                print('Months behind in the run from ' + run_time + ':')
+                # the largest bucket gets 60 #s and the others the same share of it (at least one # if it isn't empty)
+                largest = max([count for label, count in histogram] + [1])
+                for label, count in histogram:
+                    bar = '#' * max(round(count * 60 / largest), 1 if count else 0)
+                    print('    ' + label.ljust(24) + str(count).rjust(8) + ' ' + bar)
+        raise SystemExit
+
+    if args.build_snapshot is not None:
+        catalog_set = load_available_catalog_set([release_type for release_type, family, webpage in sql_versions], 
+                                                 args.cache_dir if args.cache_dir is not None else default_cache_dir(),
+                                                 cache_ttl_hours=args.cache_ttl, offline=args.offline, refresh=args.refresh_catalogs,
+                                                 catalog_url=args.catalog_url, timeout=args.catalog_timeout,
+                                                 retries=args.catalog_retries)
+        write_catalog_snapshot(args.build_snapshot, catalog_set, args.catalog_url)
+        print('Saved the builds of SQL Server ' + ', '.join(catalog_set.release_types) + ' in ' + args.build_snapshot + 
+              ' (' + str(os.path.getsize(args.build_snapshot)) + ' bytes)')
+        raise SystemExit
+
+    if args.serve is not None:
+        host, port = args.serve.rsplit(':', 1) if ':' in args.serve else ('127.0.0.1', args.serve)
+        serve(host, int(port), cache_dir=args.cache_dir, cache_ttl_hours=args.cache_ttl, offline=args.offline,
+              catalog_url=args.catalog_url, catalog_timeout=args.catalog_timeout, catalog_retries=args.catalog_retries,
+              current_within_months=args.current_within, catalog_refresh_minutes=args.catalog_refresh,
+              catalog_snapshot=args.catalog_snapshot)
+        raise SystemExit
+
+    if args.watch is not None:
+        output_directory = args.output_dir if args.output_dir is not None else os.path.join(args.watch, 'reports')
+        watch(args.watch, output_directory, pattern=args.watch_pattern, poll_seconds=args.poll_seconds,
+              catalog_refresh_minutes=args.catalog_refresh, cache_dir=args.cache_dir, cache_ttl_hours=args.cache_ttl,
+              offline=args.offline, catalog_url=args.catalog_url, catalog_timeout=args.catalog_timeout,
+              catalog_retries=args.catalog_retries, current_within_months=args.current_within,
+              staleness_buckets=staleness_buckets, use_mmap=args.mmap, history=args.history, history_db=args.history_db,
+              catalog_snapshot=args.catalog_snapshot, columnar=columnar)
+        raise SystemExit
+
+    main(input_files=args.inputs, offline=args.offline, refresh_catalogs=args.refresh_catalogs, cache_ttl_hours=args.cache_ttl, cache_dir=args.cache_dir,
+         catalog_url=args.catalog_url, catalog_timeout=args.catalog_timeout, catalog_retries=args.catalog_retries,
+         current_within_months=args.current_within,
+         staleness_buckets=staleness_buckets,
+         workers=args.workers, use_mmap=args.mmap, incremental=args.incremental, state_file=args.state_file,
+         history=args.history, history_db=args.history_db, per_input_reports=args.per_input_reports,
+         profile_file=args.profile, profile_with=args.profile_with, output_directory=args.output_dir, parse_only=args.parse_only,
+         catalog_snapshot=args.catalog_snapshot, columnar=columnar)
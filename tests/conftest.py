@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the scripts aren't a package, so make them importable the same way they import each other
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
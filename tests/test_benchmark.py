@@ -0,0 +1,54 @@
+'''
+times the parse, catalog, enrich and report stages (the same ones as code/benchmarkParseOutput.py) on 1000 fake
+servers with pytest-benchmark - only runs when it's installed (pip install pytest-benchmark), and
+"python -m pytest tests/test_benchmark.py --benchmark-autosave" / "--benchmark-compare" keep times to compare against
+benchmarkParseOutput.py is still the one for 100k - 1M servers, which is too slow to run with the tests
+'''
+
+import os
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+import benchmarkParseOutput
+import generateSCCMoutput
+import parseOutputOfPowerShellSCCM as parser
+
+servers = 1000
+
+
+@pytest.fixture(scope='module')
+def fake_input(tmp_path_factory):
+    # (input file, its records and counts, the catalog set for them)
+    filename = str(tmp_path_factory.mktemp('benchmark') / ('sccm-' + str(servers) + '.txt'))
+    generateSCCMoutput.write_sccm_output(filename, servers)
+    records, counts = parser.parse_sccm_file(filename)
+    catalog_set = parser.load_catalog_set(parser.release_types_in(records), benchmarkParseOutput.default_catalogs, offline=True)
+    return filename, records, counts, catalog_set
+
+
+def test_parse(benchmark, fake_input):
+    filename, records, counts, catalog_set = fake_input
+    assert benchmark(parser.parse_sccm_file, filename)[0] == records
+
+
+def test_catalog(benchmark, fake_input, tmp_path):
+    # reading the saved webpages, like a run does whenever its cached copy is too old
+    filename, records, counts, catalog_set = fake_input
+    release_types = parser.release_types_in(records)
+    loaded = benchmark(parser.load_catalog_set, release_types, str(tmp_path), refresh=True,
+                       catalog_url=benchmarkParseOutput.default_pages)
+    assert loaded.indexes == catalog_set.indexes
+
+
+def test_enrich(benchmark, fake_input):
+    filename, records, counts, catalog_set = fake_input
+    enriched = benchmark(parser.enrich_records, records, catalog_set)
+    assert len(enriched['sql_rows']) == counts['sql_instances']
+
+
+def test_report(benchmark, fake_input, tmp_path):
+    filename, records, counts, catalog_set = fake_input
+    benchmark(parser.write_report, str(tmp_path), records, counts, catalog_set)
+    assert os.path.exists(str(tmp_path / 'serversWithMSSQL.csv'))
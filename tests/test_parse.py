@@ -0,0 +1,419 @@
+'''
+checks that the different ways of reading the SCCM output agree with each other, and the version
+columns for the samples (run with "python -m pytest" from the top directory)
+'''
+
+import os
+
+import pytest
+
+import generateSCCMoutput
+import parseOutputOfPowerShellSCCM as parser
+
+samples_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'samples')
+sample_catalogs = os.path.join(samples_directory, 'catalogs')
+
+# servers with more than one instance, -Compact lines, warnings and broken blocks
+instances_output = '''A\t1\t0\t"MSSQLv1|MSSQLSERVER|True|Std|14.0.3294.2|RTM|"
+B\t1\t0\tWARNING: x [ "MSSQLv1|MSSQLSERVER|False||||err", "MSSQLv1|SQL2|True|Ent|13.0.5026.0|SP2|" ]
+C\t1\t0
+D\t1\t0\t[
+  "MSSQLv1|MSSQLSERVER|True|Std|15.0.2000.5|RTM|",
+  "MSSQLv1|REPORTS|False||||Login failed"
+]
+E\t1\t0\t[
+  "SQL Instance : MSSQLSERVER",
+  "Did SQL Query Run? : True",
+  "Result of Query:",
+  {
+    "Result": "Std",
+    "Query": "Edition"
+  },
+  {
+    "Result": "12.0.2000.8",
+    "Query": "Product Version"
+  },
+  {
+    "Result": "RTM",
+    "Query": "Product Level"
+  },
+  "SQL Instance : SHARE",
+  "Did SQL Query Run? : False",
+  "Error : Login failed for user 'DOMAIN\\\\SCCM$'.",
+  "Result of Query:"
+]
+F\t1\t0\tWARNING: y [  "Did SQL Query Run? : False",  "Result of Query:" ]
+'''
+
+
+def text_records(filename):
+    with open(filename, 'r') as reader:
+        return list(parser.parse_sccm_output(reader))
+
+
+@pytest.fixture(scope='module')
+def fake_outputs(tmp_path_factory):
+    # a verbose and a -Compact file with the same 3000 servers
+    directory = tmp_path_factory.mktemp('sccm')
+    verbose = str(directory / 'verbose.txt')
+    compact = str(directory / 'compact.txt')
+    generateSCCMoutput.write_sccm_output(verbose, 3000, seed=7)
+    generateSCCMoutput.write_sccm_output(compact, 3000, seed=7, compact=True)
+    return verbose, compact
+
+
+@pytest.fixture(scope='module')
+def catalog_set():
+    return parser.load_catalog_set(generateSCCMoutput.catalog_release_types, sample_catalogs, offline=True)
+
+
+def test_mmap_matches_text(fake_outputs):
+    for filename in fake_outputs:
+        assert list(parser.parse_sccm_mmap(filename)) == text_records(filename)
+
+
+def test_compact_matches_verbose(fake_outputs):
+    verbose, compact = fake_outputs
+    assert text_records(compact) == text_records(verbose)
+
+
+def test_instances(tmp_path):
+    filename = str(tmp_path / 'instances.txt')
+    with open(filename, 'w') as output:
+        output.write(instances_output)
+
+    records = text_records(filename)
+    assert list(parser.parse_sccm_mmap(filename)) == records
+    assert [record.server for record in records] == ['A', 'B', 'B\\SQL2', 'C', 'D', 'D\\REPORTS', 'E', 'E\\SHARE', 'F']
+    assert records[2] == parser.ServerRecord('B\\SQL2', True, 'Ent', '13.0.5026.0', 'SP2', 'WARNING: x')
+    assert records[3].query_ran is None
+    assert records[6].product_version == '12.0.2000.8'
+    assert records[8].warning == 'WARNING: y'
+
+    # every server is counted once, however many instances it has
+    counts = parser.count_records(records)
+    assert (counts['servers'], counts['has_sql'], counts['not_with_sql'], counts['didnot_run']) == (6, 4, 1, 1)
+    assert (counts['gave_warning'], counts['sql_instances']) == (1, 4)
+
+
+def test_query_line_before_first_server(tmp_path):
+    filename = str(tmp_path / 'stray.txt')
+    with open(filename, 'w') as output:
+        output.write('  "Did SQL Query Run? : True",\n' + instances_output)
+    assert list(parser.parse_sccm_mmap(filename)) == text_records(filename)
+
+
+@pytest.mark.parametrize('use_mmap', [False, True])
+def test_shards_match_whole_file(fake_outputs, use_mmap):
+    verbose, compact = fake_outputs
+    for filename in fake_outputs:
+        whole, whole_counts = parser.parse_sccm_shard(filename, 0, os.path.getsize(filename), use_mmap)
+        boundaries = parser.shard_boundaries(filename, os.path.getsize(filename), 7)
+        assert len(boundaries) == 8
+        records = []
+        for start, end in zip(boundaries, boundaries[1:]):
+            records.extend(parser.parse_sccm_shard(filename, start, end, use_mmap)[0])
+        assert records == whole
+
+
+def compress(filename, compressed, compression):
+    # writes a compressed copy of filename the way the command line tools would
+    if compression == 'zstd':
+        zstandard = pytest.importorskip('zstandard')
+        with open(filename, 'rb') as reader, open(compressed, 'wb') as output:
+            zstandard.ZstdCompressor().copy_stream(reader, output)
+        return
+    import bz2
+    import gzip
+    import lzma
+    import shutil
+    opener = {'gzip': gzip.open, 'xz': lzma.open, 'bz2': bz2.open}[compression]
+    with open(filename, 'rb') as reader, opener(compressed, 'wb') as output:
+        shutil.copyfileobj(reader, output)
+
+
+@pytest.mark.parametrize('compression, extension', [('gzip', '.gz'), ('xz', '.xz'), ('bz2', '.bz2'), ('zstd', '.zst')])
+def test_compressed_matches_plain(tmp_path, fake_outputs, compression, extension):
+    for filename in fake_outputs:
+        compressed = str(tmp_path / (os.path.basename(filename) + extension))
+        compress(filename, compressed, compression)
+        assert parser.compression_of(compressed) == compression
+        assert parser.parse_sccm_file(compressed) == parser.parse_sccm_file(filename)
+        # recognized from the start of the file, not its name
+        renamed = str(tmp_path / 'export.txt')
+        os.replace(compressed, renamed)
+        assert parser.parse_sccm_file(renamed, workers=4, use_mmap=True) == parser.parse_sccm_file(filename)
+    assert parser.compression_of(fake_outputs[0]) is None
+
+
+def test_without_extension():
+    assert parser.without_extension('exports/export.txt') == 'exports/export'
+    assert parser.without_extension('exports/export.txt.gz') == 'exports/export'
+    assert parser.without_extension('export.TXT.ZST') == 'export'
+    assert parser.without_extension('export.gz') == 'export'
+
+
+def test_staleness_matches_relativedelta():
+    relativedelta = pytest.importorskip('dateutil.relativedelta').relativedelta
+    from datetime import date, timedelta
+
+    # every pair of days over a couple of years, including month ends and leap days
+    days = [date(2019, 12, 1) + timedelta(days=day) for day in range(0, 500, 3)] + [date(2020, 1, 31), date(2020, 2, 29)]
+    curr_dates = []
+    last_dates = []
+    for curr in days:
+        for last in days:
+            curr_dates.append(curr.isoformat())
+            last_dates.append(last.isoformat())
+    months_behind, is_current, known, bucket_counts = parser.compute_staleness(curr_dates, last_dates)
+
+    expected = []
+    for curr, last in zip(curr_dates, last_dates):
+        difference = relativedelta(date.fromisoformat(last), date.fromisoformat(curr))
+        expected.append(difference.years * 12 + difference.months)
+    assert known.all()
+    assert list(months_behind) == expected
+
+
+def test_staleness_unknown_dates():
+    months_behind, is_current, known, bucket_counts = parser.compute_staleness(['2020-04-07', '', '2020', '2020-02-30'],
+                                                                               ['2020-07-01'] * 4)
+    assert list(known) == [True, False, False, False]
+    assert months_behind[0] == 2
+
+
+def test_security_update_tracks(catalog_set):
+    index = catalog_set.indexes['2017']
+    # RTM GDR track - only the GDR security updates count
+    assert parser.security_update_needed(index, parser.parse_build('14.0.1000.169')) == 'KB4505224'
+    assert parser.security_update_needed(index, parser.parse_build('14.0.2027.2')) == 'False'
+    # CU track - the CU security updates
+    assert parser.security_update_needed(index, parser.parse_build('14.0.3048.4')) == 'KB4505225'
+    assert parser.security_update_needed(index, parser.parse_build('14.0.3294.2')) == 'False'
+
+    index = catalog_set.indexes['2014']
+    assert parser.security_update_needed(index, parser.parse_build('12.0.5223.6')) == 'False'
+    assert parser.security_update_needed(index, parser.parse_build('12.0.6024.0')) == 'KB4532095'
+    assert parser.security_update_needed(index, parser.parse_build('12.0.6329.1')) == 'KB4535288'
+
+
+def test_latest_cumulative_update_for_service_pack(catalog_set):
+    # each server gets the newest CU of its own service pack, not of the newest service pack
+    records = [parser.ServerRecord('SP2', True, 'Standard Edition (64-bit)', '12.0.5223.6', 'SP2', ''),
+               parser.ServerRecord('SP3', True, 'Standard Edition (64-bit)', '12.0.6024.0', 'SP3', '')]
+    rows = parser.enrich_records(records, catalog_set)['sql_rows']
+    index = catalog_set.indexes['2014']
+    for row in rows:
+        branch, branch_latest_cu = parser.branch_status(index, parser.parse_build(row[3]))[:2]
+        assert branch == row[4]
+        assert row[12] == parser.build_string(branch_latest_cu)
+    assert rows[0][12] != rows[1][12]
+
+
+def test_sample_builds_are_in_the_catalogs(catalog_set):
+    records = text_records(os.path.join(samples_directory, 'input', 'SCCMresult.txt'))
+    for record in records:
+        if record.product_version:
+            assert record.product_version in catalog_set.indexes[parser.sql_release_type(record.product_version)].builds
+
+
+def test_sample_output_is_up_to_date(tmp_path):
+    # samples/output is what the program writes for samples/input with the sample catalogs
+    records, counts = parser.parse_sccm_file(os.path.join(samples_directory, 'input', 'SCCMresult.txt'))
+    catalog_set = parser.load_catalog_set(parser.release_types_in(records), sample_catalogs, offline=True)
+    parser.write_report(str(tmp_path), records, counts, catalog_set)
+    for written, sample in [('allScannedServers.csv', 'allScannedServers.csv'), ('serversWithMSSQL.csv', 'serversWithMSSQL.csv'),
+                            ('MSSQLoutputStats', 'MSSQLoutputStats.txt')]:
+        with open(str(tmp_path / written), 'r') as output, open(os.path.join(samples_directory, 'output', sample), 'r') as expected:
+            assert output.read() == expected.read(), sample
+
+
+def test_snapshot_leaves_out_missing_versions(tmp_path, catalog_set, capsys):
+    snapshot = str(tmp_path / 'snapshot.json')
+    parser.write_catalog_snapshot(snapshot, catalog_set)
+    loaded = parser.read_catalog_snapshot(snapshot, ['2017', '2005'])
+    assert loaded.release_types == ['2017']
+    assert 'SQL Server 2005 is not in the catalog snapshot' in capsys.readouterr().out
+
+    with pytest.raises(parser.CatalogSnapshotError):
+        parser.read_catalog_snapshot(str(tmp_path / 'missing.json'))
+
+
+def test_snapshot_matches_the_catalogs(tmp_path, catalog_set, fake_outputs):
+    # reading a snapshot gives the same build indexes, and so the same results, as loading the catalogs
+    snapshot = str(tmp_path / 'snapshot.json')
+    parser.write_catalog_snapshot(snapshot, catalog_set)
+    loaded = parser.read_catalog_snapshot(snapshot)
+    assert sorted(loaded.release_types) == sorted(catalog_set.release_types)
+    for release_type in catalog_set.release_types:
+        assert loaded.indexes[release_type] == catalog_set.indexes[release_type], release_type
+        assert loaded.last_release_dates[release_type] == catalog_set.last_release_dates[release_type]
+        assert loaded.highest_sps[release_type] == catalog_set.highest_sps[release_type]
+        assert loaded.signatures[release_type] == catalog_set.signatures[release_type]
+
+    records = text_records(fake_outputs[0])
+    expected = parser.enrich_records(records, catalog_set)
+    enriched = parser.enrich_records(records, loaded)
+    for name in ['sql_rows', 'release_types', 'bucket_counts', 'not_current', 'outofdate_sp', 'security_needed', 'state']:
+        assert enriched[name] == expected[name], name
+    assert list(enriched['months_behind']) == list(expected['months_behind'])
+    assert list(enriched['known']) == list(expected['known'])
+
+
+def test_newest_update_without_new_marker():
+    # a webpage where no row is marked "*new" - the newest release date is used
+    catalog = parser.catalog_dataframe({'Build': ['14.0.3294.2', '14.0.1000.169'], 'Release Date': ['2020-04-07', '2017-10-02'],
+                                        'KB / Description': ['KB4541283 Cumulative update 20 (CU20) for SQL Server 2017',
+                                                             'Microsoft SQL Server 2017 RTM']})
+    index = parser.build_index(catalog)
+    assert parser.recent_release(index) == '2020-04-07'
+    assert '2020-04-07' in parser.catalog_signature(index, parser.recent_release(index), '')
+    assert parser.recent_release(parser.build_index(parser.catalog_dataframe({'Build': [], 'Release Date': [], 'KB / Description': []}))) == ''
+
+
+def test_state_from_another_version_is_not_used(tmp_path):
+    import json
+
+    state_file = str(tmp_path / 'state.json')
+    servers = {'SERVER1': {'fingerprint': 'x', 'record': ['SERVER1', False, '', '', '', '']}}
+    parser.save_state(state_file, servers)
+    assert parser.load_state(state_file) == servers
+
+    # a state file from before the format field (or with another format) is started over
+    with open(state_file, 'w') as state:
+        json.dump({'saved': 0, 'servers': servers}, state)
+    assert parser.load_state(state_file) == {}
+
+
+def test_watch_tries_a_failed_file_again(tmp_path, monkeypatch, capsys):
+    # the first catalog load fails (like a network blip) - the file is picked up again and its report written
+    directory = tmp_path / 'drop'
+    directory.mkdir()
+    output_directory = str(tmp_path / 'reports')
+    with open(os.path.join(samples_directory, 'input', 'SCCMresult.txt'), 'r') as sample:
+        (directory / 'collection.txt').write_text(sample.read())
+
+    warm_catalog_set = parser.warm_catalog_set
+    calls = []
+
+    def flaky_warm_catalog_set(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError('network is unreachable')
+        return warm_catalog_set(*args, **kwargs)
+
+    monkeypatch.setattr(parser, 'warm_catalog_set', flaky_warm_catalog_set)
+    parser.watch(str(directory), output_directory, poll_seconds=0, cache_dir=sample_catalogs, offline=True, max_polls=5)
+
+    assert len(calls) == 2
+    assert 'network is unreachable' in capsys.readouterr().out
+    assert sorted(os.listdir(output_directory)) == ['collection']
+    assert 'serversWithMSSQL.csv' in os.listdir(os.path.join(output_directory, 'collection'))
+
+
+def test_replacing_file_leaves_the_old_file_when_writing_fails(tmp_path):
+    filename = str(tmp_path / 'state.json')
+    with parser.replacing_file(filename) as output:
+        output.write('old')
+    with pytest.raises(RuntimeError):
+        with parser.replacing_file(filename) as output:
+            output.write('half of the new')
+            raise RuntimeError('interrupted')
+    with open(filename) as written:
+        assert written.read() == 'old'
+    assert os.listdir(str(tmp_path)) == ['state.json']
+
+
+def test_columnar_security_update_unknown(tmp_path, catalog_set):
+    pa = pytest.importorskip('pyarrow')
+    records = [parser.ServerRecord('GDR', True, 'Standard Edition (64-bit)', '14.0.1000.169', 'RTM', ''),
+               parser.ServerRecord('CU', True, 'Standard Edition (64-bit)', '14.0.3294.2', 'RTM', ''),
+               parser.ServerRecord('OLD', True, 'Standard Edition (64-bit)', '14.0.3294.2', 'RTM', '')]
+    enriched = parser.enrich_records(records, catalog_set)
+    # a SQL version whose webpage doesn't list any security updates
+    enriched['sql_rows'][2][9] = ''
+    parser.write_columnar(str(tmp_path), records, enriched)
+    table = pa.ipc.open_file(pa.memory_map(str(tmp_path / 'serversWithMSSQL.arrow'))).read_all()
+    assert table.column('security_update_needed').to_pylist() == [True, False, None]
+    assert table.column('security_update').to_pylist() == ['KB4505224', None, None]
+
+
+@pytest.fixture
+def page_server():
+    # samples/pages served over http on a free port, standing in for sqlserverbuilds - settings['delay'] slows every
+    # answer down, settings['fail_first'] are pages that answer 503 the first time they're asked for
+    import functools
+    import http.server
+    import threading
+    import time
+
+    pytest.importorskip('lxml')
+    settings = {'delay': 0, 'fail_first': set(), 'requests': [], 'in_flight': 0, 'most_in_flight': 0}
+    lock = threading.Lock()
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *arguments):
+            pass
+
+        def do_GET(self):
+            with lock:
+                first = self.path not in settings['requests']
+                settings['requests'].append(self.path)
+                settings['in_flight'] += 1
+                settings['most_in_flight'] = max(settings['most_in_flight'], settings['in_flight'])
+            try:
+                time.sleep(settings['delay'])
+                if first and any(self.path.endswith(page) for page in settings['fail_first']):
+                    self.send_error(503)
+                else:
+                    super().do_GET()
+            finally:
+                with lock:
+                    settings['in_flight'] -= 1
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                             functools.partial(Handler, directory=os.path.join(samples_directory, 'pages')))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:' + str(server.server_port), settings
+    server.shutdown()
+    server.server_close()
+
+
+def test_catalogs_load_at_the_same_time(tmp_path, page_server):
+    import json
+    url, settings = page_server
+    settings['delay'] = 0.3
+    release_types = ['2019', '2017', '2016', '2014']
+    sources = {}
+    catalogs = parser.prefetch_catalogs(release_types, str(tmp_path), catalog_url=url, sources=sources)
+    assert settings['most_in_flight'] > 1
+    assert len(settings['requests']) == len(release_types)
+    assert sources == dict.fromkeys(release_types, 'download')
+
+    # the same builds as the catalog fixtures made from the same pages
+    for release_type in release_types:
+        webpage = parser.sqlserverbuilds_url + dict((row[0], row[2]) for row in parser.sql_versions)[release_type]
+        with open(parser.catalog_cache_file(sample_catalogs, release_type, webpage)) as fixture:
+            assert list(catalogs[release_type]['Build']) == json.load(fixture)['columns']['Build']
+
+    # and the second time they come from the cache
+    parser.prefetch_catalogs(release_types, str(tmp_path), catalog_url=url, sources=sources)
+    assert len(settings['requests']) == len(release_types)
+    assert sources == dict.fromkeys(release_types, 'cache')
+
+
+def test_catalog_download_timeout_and_retry(page_server):
+    url, settings = page_server
+    webpage = url + '/2017/01/sql-server-2017-versions.html'
+
+    # a page that answers 503 the first time is asked for again
+    settings['fail_first'] = {'sql-server-2017-versions.html'}
+    columns = parser.fetch_catalog(webpage, timeout=5, retries=1)
+    assert '14.0.3294.2' in columns['Build']
+    assert settings['requests'] == ['/2017/01/sql-server-2017-versions.html'] * 2
+
+    # a page that takes longer than the timeout is given up on
+    settings['delay'] = 1
+    with pytest.raises(OSError):
+        parser.fetch_catalog(webpage, timeout=0.2, retries=0)